@@ -0,0 +1,319 @@
+import os
+import time
+import asyncio
+import logging
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from azure.ai.agents.models import ListSortOrder, RunStatus, ThreadRun
+
+logger = logging.getLogger("agent_gateway")
+logger.setLevel(logging.INFO)
+
+
+# ============================================================
+# ENV CONFIG
+# ============================================================
+# Max agent runs allowed in flight per worker. Extra runs wait in the queue.
+AGENT_MAX_CONCURRENT_RUNS = int(os.getenv("AGENT_MAX_CONCURRENT_RUNS", "8"))
+
+# Threads used for the blocking SDK calls (runs + cheap calls like threads.get).
+AGENT_EXECUTOR_WORKERS = int(
+    os.getenv("AGENT_EXECUTOR_WORKERS", str(AGENT_MAX_CONCURRENT_RUNS * 2))
+)
+
+# Default and maximum wall-clock budget for one agent run, including the wait
+# for a run slot. Requests may ask for less (or more, up to the max).
+AGENT_RUN_DEADLINE_SECONDS = float(os.getenv("AGENT_RUN_DEADLINE_SECONDS", "120"))
+AGENT_RUN_MAX_DEADLINE_SECONDS = float(os.getenv("AGENT_RUN_MAX_DEADLINE_SECONDS", "300"))
+
+# Run status polling starts fast (short answers finish in a few seconds) and
+# backs off geometrically to the max interval.
+AGENT_POLL_INTERVAL_SECONDS = float(os.getenv("AGENT_POLL_INTERVAL_SECONDS", "0.5"))
+AGENT_POLL_MAX_INTERVAL_SECONDS = float(os.getenv("AGENT_POLL_MAX_INTERVAL_SECONDS", "2"))
+AGENT_POLL_BACKOFF = float(os.getenv("AGENT_POLL_BACKOFF", "1.5"))
+
+ACTIVE_RUN_STATUSES = {RunStatus.QUEUED, RunStatus.IN_PROGRESS}
+
+
+class RunDeadlineExceeded(Exception):
+    """The run did not finish within its deadline and was cancelled."""
+
+    def __init__(self, deadline_seconds: float):
+        super().__init__(f"Agent run exceeded its {deadline_seconds:g}s deadline")
+        self.deadline_seconds = deadline_seconds
+
+
+def resolve_deadline(requested=None) -> float:
+    """Clamps a per-request deadline to (0, AGENT_RUN_MAX_DEADLINE_SECONDS]."""
+    if not requested or requested <= 0:
+        return AGENT_RUN_DEADLINE_SECONDS
+    return min(float(requested), AGENT_RUN_MAX_DEADLINE_SECONDS)
+
+
+# ============================================================
+# AGENT GATEWAY
+# ============================================================
+class AgentGateway:
+    """
+    Runs the synchronous Azure agent SDK calls on a bounded thread pool
+    so the event loop keeps serving other requests while a run is in
+    progress. Agent runs are additionally capped by a semaphore; callers
+    beyond the cap wait in a queue whose depth is reported by stats().
+    """
+
+    def __init__(self, client, max_concurrent_runs: int, executor_workers: int):
+        self._client = client
+        self._executor = ThreadPoolExecutor(
+            max_workers=executor_workers,
+            thread_name_prefix="agent-gateway"
+        )
+        self._run_slots = asyncio.Semaphore(max_concurrent_runs)
+        self._max_concurrent_runs = max_concurrent_runs
+
+        self._queued = 0
+        self._peak_queued = 0
+        self._running = 0
+        self._completed = 0
+        self._failed = 0
+        self._timed_out = 0
+        self._cancelled = 0
+
+    # --------------------------------------------------------
+    # Plumbing
+    # --------------------------------------------------------
+    async def _call(self, fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, functools.partial(fn, *args, **kwargs)
+        )
+
+    async def _acquire_run_slot(self):
+        self._queued += 1
+        self._peak_queued = max(self._peak_queued, self._queued)
+        try:
+            await self._run_slots.acquire()
+        finally:
+            self._queued -= 1
+        self._running += 1
+
+    def _release_run_slot(self, failed: bool):
+        self._running -= 1
+        self._run_slots.release()
+        if failed:
+            self._failed += 1
+        else:
+            self._completed += 1
+
+    async def _acquire_run_slot_by(self, deadline: float, deadline_seconds: float):
+        try:
+            await asyncio.wait_for(self._acquire_run_slot(), max(deadline - time.monotonic(), 0))
+        except asyncio.TimeoutError:
+            self._timed_out += 1
+            raise RunDeadlineExceeded(deadline_seconds)
+
+    def _cancel_run(self, thread_id: str, run_id: str):
+        """
+        Fire-and-forget runs.cancel, so it also works from a task that is
+        itself being cancelled. Frees the Azure side of an abandoned run.
+        Never raises: callers use it in finally blocks that must still
+        release their run slot.
+        """
+        self._cancelled += 1
+
+        def _cancel():
+            try:
+                self._client.agents.runs.cancel(thread_id=thread_id, run_id=run_id)
+                logger.info(f"Cancelled agent run {run_id} on thread {thread_id}")
+            except Exception as e:
+                logger.warning(f"Could not cancel agent run {run_id}: {e}")
+
+        try:
+            self._executor.submit(_cancel)
+        except RuntimeError:
+            # Executor already shut down; the run still has to be cancelled
+            threading.Thread(target=_cancel, name="agent-gateway-cancel", daemon=True).start()
+
+    def stats(self) -> dict:
+        return {
+            "max_concurrent_runs": self._max_concurrent_runs,
+            "running": self._running,
+            "queued": self._queued,
+            "peak_queued": self._peak_queued,
+            "completed": self._completed,
+            "failed": self._failed,
+            "timed_out": self._timed_out,
+            "cancelled": self._cancelled,
+        }
+
+    def shutdown(self):
+        # Queued calls still run, so pending run cancellations reach Azure
+        self._executor.shutdown(wait=False)
+
+    # --------------------------------------------------------
+    # SDK operations
+    # --------------------------------------------------------
+    async def get_thread(self, thread_id: str):
+        return await self._call(self._client.agents.threads.get, thread_id=thread_id)
+
+    async def create_thread(self):
+        return await self._call(self._client.agents.threads.create)
+
+    async def create_message(self, thread_id: str, role: str, content: str):
+        return await self._call(
+            self._client.agents.messages.create,
+            thread_id=thread_id,
+            role=role,
+            content=content
+        )
+
+    async def run_to_completion(
+        self,
+        thread_id: str,
+        agent_id: str,
+        deadline_seconds: float = AGENT_RUN_DEADLINE_SECONDS
+    ):
+        """
+        Creates a run and polls it (with backoff) until it leaves the active
+        states. Unlike runs.create_and_process the poll sleeps on the loop,
+        not in an executor thread, and the run is bounded by a deadline:
+        past it the run is cancelled and RunDeadlineExceeded raised. If the
+        awaiting task is cancelled (client gone) the run is cancelled too.
+        """
+        deadline = time.monotonic() + deadline_seconds
+        await self._acquire_run_slot_by(deadline, deadline_seconds)
+
+        run = None
+        failed = True
+        try:
+            run = await self._call(
+                self._client.agents.runs.create,
+                thread_id=thread_id,
+                agent_id=agent_id
+            )
+
+            interval = AGENT_POLL_INTERVAL_SECONDS
+            while run.status in ACTIVE_RUN_STATUSES:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._timed_out += 1
+                    raise RunDeadlineExceeded(deadline_seconds)
+
+                await asyncio.sleep(min(interval, remaining))
+                interval = min(interval * AGENT_POLL_BACKOFF, AGENT_POLL_MAX_INTERVAL_SECONDS)
+                run = await self._call(
+                    self._client.agents.runs.get,
+                    thread_id=thread_id,
+                    run_id=run.id
+                )
+
+            if run.status == RunStatus.REQUIRES_ACTION:
+                # The agent has no client-side tools; same as create_and_process
+                logger.warning(f"Run {run.id} requires action, cancelling")
+                self._cancel_run(thread_id, run.id)
+
+            failed = run.status != RunStatus.COMPLETED
+            return run
+        finally:
+            if run is not None and run.status in ACTIVE_RUN_STATUSES:
+                self._cancel_run(thread_id, run.id)
+            self._release_run_slot(failed)
+
+    async def stream_run(
+        self,
+        thread_id: str,
+        agent_id: str,
+        deadline_seconds: float = AGENT_RUN_DEADLINE_SECONDS
+    ):
+        """
+        Async generator over the SDK run stream, yielding (event_type, event_data).
+        The blocking stream is drained on the executor and handed to the loop
+        through a queue; closing the generator stops the reader thread. A run
+        that is abandoned (generator closed early) or outlives the deadline
+        (RunDeadlineExceeded) is cancelled.
+        """
+        loop = asyncio.get_running_loop()
+        events: asyncio.Queue = asyncio.Queue()
+        stop = threading.Event()
+        done = object()
+
+        def _reader():
+            try:
+                with self._client.agents.runs.stream(
+                    thread_id=thread_id,
+                    agent_id=agent_id
+                ) as stream:
+                    for event_type, event_data, _ in stream:
+                        if stop.is_set():
+                            break
+                        loop.call_soon_threadsafe(events.put_nowait, (event_type, event_data))
+            except Exception as e:
+                loop.call_soon_threadsafe(events.put_nowait, e)
+            finally:
+                loop.call_soon_threadsafe(events.put_nowait, done)
+
+        deadline = time.monotonic() + deadline_seconds
+        await self._acquire_run_slot_by(deadline, deadline_seconds)
+
+        run_id = None
+        finished = False
+        failed = True
+        try:
+            reader = loop.run_in_executor(self._executor, _reader)
+            while True:
+                try:
+                    item = await asyncio.wait_for(
+                        events.get(), max(deadline - time.monotonic(), 0)
+                    )
+                except asyncio.TimeoutError:
+                    self._timed_out += 1
+                    raise RunDeadlineExceeded(deadline_seconds)
+
+                if item is done:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+
+                _, event_data = item
+                if isinstance(event_data, ThreadRun):
+                    run_id = event_data.id
+                    if event_data.status not in ACTIVE_RUN_STATUSES:
+                        finished = True
+                yield item
+            finished = True
+            await reader
+            failed = False
+        finally:
+            stop.set()
+            if run_id is not None and not finished:
+                self._cancel_run(thread_id, run_id)
+            self._release_run_slot(failed)
+
+    async def get_run_reply(self, thread_id: str, run_id: str) -> str:
+        """
+        Returns the text the given run added to the thread. Messages are read
+        newest-first filtered by run, and paging stops at the first message
+        from an earlier turn, so cost does not grow with thread length.
+        """
+        def _collect():
+            run_messages = []
+            for msg in self._client.agents.messages.list(
+                thread_id=thread_id,
+                run_id=run_id,
+                order=ListSortOrder.DESCENDING
+            ):
+                if msg.run_id != run_id:
+                    if run_messages:
+                        break
+                    continue
+                run_messages.append(msg)
+
+            parts = []
+            for msg in reversed(run_messages):
+                for text_message in getattr(msg, "text_messages", None) or []:
+                    parts.append(text_message.text.value)
+
+            return "\n\n".join(p.strip() for p in parts if p and p.strip())
+
+        return await self._call(_collect)
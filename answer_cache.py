@@ -0,0 +1,199 @@
+import os
+import re
+import time
+import struct
+import hashlib
+import threading
+from collections import OrderedDict, defaultdict
+from typing import Optional
+
+# ============================================================
+# ENV CONFIG
+# ============================================================
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "2000"))
+ANSWER_CACHE_TTL_SECONDS = int(os.getenv("ANSWER_CACHE_TTL_SECONDS", str(24 * 3600)))
+
+# Minimum estimated Jaccard similarity for a near-duplicate question to count as a hit
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.75"))
+
+# MinHash signature = BANDS * ROWS hashes; LSH buckets by band
+MINHASH_BANDS = 16
+MINHASH_ROWS = 4
+SHINGLE_SIZE = 3
+
+_MERSENNE = (1 << 61) - 1
+_PERMUTATIONS = [
+    (
+        int.from_bytes(hashlib.blake2b(f"a{i}".encode(), digest_size=8).digest(), "little") % _MERSENNE | 1,
+        int.from_bytes(hashlib.blake2b(f"b{i}".encode(), digest_size=8).digest(), "little") % _MERSENNE,
+    )
+    for i in range(MINHASH_BANDS * MINHASH_ROWS)
+]
+
+NON_WORD_RE = re.compile(r"[^a-z0-9 ]+")
+NUMBER_RE = re.compile(r"\d+[a-z]?")
+ARTICLES = frozenset(["a", "an", "the"])
+
+
+def normalize_question(question: str) -> str:
+    words = NON_WORD_RE.sub(" ", question.lower()).split()
+    return " ".join(w for w in words if w not in ARTICLES)
+
+
+def _numbers(normalized: str) -> frozenset:
+    # "Article 21" and "Article 22" are near-identical strings but different questions
+    return frozenset(NUMBER_RE.findall(normalized))
+
+
+def _minhash(text: str):
+    padded = f" {text} "
+    shingles = {padded[i:i + SHINGLE_SIZE] for i in range(max(1, len(padded) - SHINGLE_SIZE + 1))}
+    hashes = [
+        struct.unpack("<Q", hashlib.blake2b(s.encode(), digest_size=8).digest())[0]
+        for s in shingles
+    ]
+    return tuple(min((a * h + b) % _MERSENNE for h in hashes) for a, b in _PERMUTATIONS)
+
+
+def _bands(signature):
+    for band in range(MINHASH_BANDS):
+        yield band, signature[band * MINHASH_ROWS:(band + 1) * MINHASH_ROWS]
+
+
+def _similarity(sig_a, sig_b) -> float:
+    return sum(1 for x, y in zip(sig_a, sig_b) if x == y) / len(sig_a)
+
+
+# ============================================================
+# ANSWER CACHE
+# ============================================================
+class _Entry:
+    __slots__ = ("context", "signature", "numbers", "reply", "run_seconds", "expires_at")
+
+    def __init__(self, context, signature, numbers, reply, run_seconds, expires_at):
+        self.context = context
+        self.signature = signature
+        self.numbers = numbers
+        self.reply = reply
+        self.run_seconds = run_seconds
+        self.expires_at = expires_at
+
+
+class AnswerCache:
+    """
+    LRU + TTL cache of agent replies keyed by normalized question and a
+    context key (hashes of the attached documents). Near-duplicate
+    questions are found through MinHash signatures bucketed by LSH band,
+    so a lookup only compares against a handful of candidates.
+    Entries are shared by all users: only replies that depend on nothing
+    but the question and the context key may be stored.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: int, similarity: float):
+        self._entries: "OrderedDict[tuple, _Entry]" = OrderedDict()
+        self._buckets = defaultdict(set)
+        self._max_entries = max_entries
+        self._ttl = ttl_seconds
+        self._similarity = similarity
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+
+    def _drop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for band in _bands(entry.signature):
+            bucket = self._buckets.get((entry.context,) + band)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self._buckets[(entry.context,) + band]
+
+    def _live(self, key, now) -> Optional[_Entry]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at <= now:
+            self._drop(key)
+            return None
+        return entry
+
+    def get(self, question: str, context: str = "") -> Optional[str]:
+        normalized = normalize_question(question)
+        key = (context, normalized)
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._live(key, now)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                self.saved_seconds += entry.run_seconds
+                return entry.reply
+
+        signature = _minhash(normalized)
+        numbers = _numbers(normalized)
+
+        with self._lock:
+            candidates = set()
+            for band in _bands(signature):
+                candidates |= self._buckets.get((context,) + band, set())
+
+            best_key, best_score = None, 0.0
+            for candidate in candidates:
+                entry = self._live(candidate, now)
+                if entry is None or entry.numbers != numbers:
+                    continue
+                score = _similarity(signature, entry.signature)
+                if score > best_score:
+                    best_key, best_score = candidate, score
+
+            if best_key is not None and best_score >= self._similarity:
+                entry = self._entries[best_key]
+                self._entries.move_to_end(best_key)
+                self.near_hits += 1
+                self.saved_seconds += entry.run_seconds
+                return entry.reply
+
+            self.misses += 1
+            return None
+
+    def put(self, question: str, reply: str, run_seconds: float, context: str = ""):
+        normalized = normalize_question(question)
+        key = (context, normalized)
+        signature = _minhash(normalized)
+
+        with self._lock:
+            self._drop(key)
+            self._entries[key] = _Entry(
+                context, signature, _numbers(normalized), reply, run_seconds,
+                time.monotonic() + self._ttl
+            )
+            for band in _bands(signature):
+                self._buckets[(context,) + band].add(key)
+
+            while len(self._entries) > self._max_entries:
+                self._drop(next(iter(self._entries)))
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.near_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "near_hits": self.near_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.hits + self.near_hits) / lookups, 4) if lookups else 0.0,
+                "saved_run_seconds": round(self.saved_seconds, 2),
+            }
+
+
+answer_cache = AnswerCache(
+    max_entries=ANSWER_CACHE_MAX_ENTRIES,
+    ttl_seconds=ANSWER_CACHE_TTL_SECONDS,
+    similarity=ANSWER_CACHE_SIMILARITY
+)
@@ -1,30 +1,54 @@
 import os
-import tempfile
+import json
+import time
+import asyncio
+import contextlib
 from typing import Optional
 from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-import fitz as pymupdf
-import docx
 from auth.routes import router as auth_router
 from auth.middleware import JWTMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse, JSONResponse
 # ---------------------- AUTH + SESSION ----------------------
 from auth.routes import router as auth_router
 from auth.middleware import JWTMiddleware
 from chat_routes import router as chat_router
  
 import re
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
  
 # -------------------------- AZURE ---------------------------
 from azure.ai.projects import AIProjectClient
 from azure.identity import DefaultAzureCredential
-from azure.ai.agents.models import ListSortOrder
-from history import get_or_create_thread, save_message
+from azure.ai.agents.models import MessageDeltaChunk, ThreadRun, RunStatus, AgentStreamEvent
+from history import new_turn, new_message, get_thread_documents, get_thread_document_texts
+from turn_writer import turn_writer
+from chat_cache import chat_cache
+from agent_gateway import (
+    AgentGateway, RunDeadlineExceeded, resolve_deadline,
+    AGENT_MAX_CONCURRENT_RUNS, AGENT_EXECUTOR_WORKERS
+)
+from query_jobs import QueryJobQueue, QUERY_JOB_WORKERS, QUERY_JOB_MAX_PENDING
+from extraction import extract_document, shutdown_pool as shutdown_extraction_pool
+from text_cache import text_cache, document_hash
+from passages import select_passages, cached_index
+from answer_cache import answer_cache
+from single_flight import SingleFlight, KeyedLocks
+from idempotency import run_idempotent, fingerprint
+from indexes import ensure_indexes
+from auth.middleware import require_roles
+from fastapi import Depends
 import logging
 from templates_router import router as templates_router
+from constitution_routes import router as constitution_router
+from download_routes import router as download_router
+from pdf_service import create_pdf, eviction_loop as pdf_eviction_loop
+from archive import archive_loop
+from search_index import index_loop as search_index_loop
+from uploads import UploadLimitMiddleware, read_upload
+from disconnect import cancel_on_disconnect
+from rate_limit import rate_limit, rate_limiter, hand_off_slot
+from constitution_index import get_index as get_constitution_index, ensure_index as ensure_constitution_index
  
 from dotenv import load_dotenv
  
@@ -54,12 +78,18 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag"],
 )
  
+# Both are plain ASGI, so the 413 raised from receive() and the client's
+# http.disconnect reach the routes unwrapped (see disconnect.py)
+app.add_middleware(UploadLimitMiddleware)
 app.add_middleware(JWTMiddleware)
 app.include_router(auth_router)
 app.include_router(chat_router)
 app.include_router(templates_router)
+app.include_router(constitution_router)
+app.include_router(download_router)
  
  
  
@@ -74,21 +104,76 @@ project_client = AIProjectClient(
 # Legal Template Generator Agent
  
 legal_agent = project_client.agents.get_agent(agent_id=os.getenv("LEGAL_AGENT_ID"))
+
+# All per-request SDK calls go through the gateway so they never block the loop
+agent_gateway = AgentGateway(
+    project_client,
+    max_concurrent_runs=AGENT_MAX_CONCURRENT_RUNS,
+    executor_workers=AGENT_EXECUTOR_WORKERS
+)
+
+
+@app.on_event("startup")
+async def create_indexes():
+    await ensure_indexes()
+
+
+@app.on_event("startup")
+async def start_pdf_eviction():
+    app.state.pdf_eviction_task = asyncio.create_task(pdf_eviction_loop())
+
+
+@app.on_event("shutdown")
+async def stop_pdf_eviction():
+    app.state.pdf_eviction_task.cancel()
+
+
+@app.on_event("startup")
+async def start_chat_archival():
+    app.state.archive_task = asyncio.create_task(archive_loop())
+
+
+@app.on_event("shutdown")
+async def stop_chat_archival():
+    app.state.archive_task.cancel()
+
+
+@app.on_event("startup")
+async def start_search_indexer():
+    app.state.search_index_task = asyncio.create_task(search_index_loop())
+
+
+@app.on_event("shutdown")
+async def stop_search_indexer():
+    app.state.search_index_task.cancel()
+
+
+@app.on_event("startup")
+async def load_constitution_index():
+    # Normally only maps the file (pages are faulted in on first lookup). When
+    # the file is missing it is built in the background; until then
+    # /constitution/search answers 503 and include_constitution adds nothing.
+    app.state.constitution_index_task = asyncio.create_task(asyncio.to_thread(ensure_constitution_index))
+
+
+@app.get("/metrics", dependencies=[Depends(require_roles("admin"))])
+async def metrics():
+    return {
+        "agent_gateway": agent_gateway.stats(),
+        "query_jobs": {"pending": query_job_queue.pending()},
+        "text_cache": text_cache.stats(),
+        "answer_cache": answer_cache.stats(),
+        "query_flights": query_flights.stats(),
+        "thread_locks": thread_locks.stats(),
+        "rate_limit": rate_limiter.stats(),
+        "turn_writer": turn_writer.stats(),
+        "chat_cache": chat_cache.stats()
+    }
  
  
 # ================================================================
 #                     DOCUMENT PROCESSING
 # ================================================================
-def extract_text_from_pdf(file_path: str) -> str:
-    try:
-        text = ""
-        with pymupdf.open(file_path) as pdf:
-            for page in pdf:
-                text += page.get_text()
-        return text
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error processing PDF: {e}")
- 
 def extract_pdf_block(text: str):
     """Extracts content inside [PDF_DOCUMENT] tags."""
     match = re.search(r"\[PDF_DOCUMENT\](.*?)\[/PDF_DOCUMENT\]", text, re.DOTALL)
@@ -97,179 +182,483 @@ def extract_pdf_block(text: str):
     return None
  
  
-def create_pdf_from_text(text: str, output_path: str):
-    """Creates a PDF file from plain text."""
-    c = canvas.Canvas(output_path, pagesize=letter)
-    width, height = letter
- 
-    y = height - 40
-    for line in text.split("\n"):
-        c.drawString(40, y, line)
-        y -= 15
- 
-        if y < 40:
-            c.showPage()
-            y = height - 40
- 
-    c.save()
- 
-def extract_text_from_docx(file_path: str) -> str:
-    try:
-        doc = docx.Document(file_path)
-        return "\n".join([p.text for p in doc.paragraphs])
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error processing DOCX: {e}")
- 
- 
-def extract_text_from_txt(file_path: str) -> str:
-    try:
-        with open(file_path, "r", encoding="utf-8", errors="ignore") as f:
-            return f.read()
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error processing TXT: {e}")
- 
- 
-def extract_text(file_path: str, filename: str) -> str:
-    ext = filename.lower().split(".")[-1]
-    if ext == "pdf": return extract_text_from_pdf(file_path)
-    if ext in ["doc", "docx"]: return extract_text_from_docx(file_path)
-    if ext == "txt": return extract_text_from_txt(file_path)
-    return ""
+async def extract_text(content: bytes, filename: str, content_hash: Optional[str] = None) -> str:
+    return await extract_document(content, filename, content_hash=content_hash)
  
  
 # ================================================================
-#                           MAIN ENDPOINT
-@app.post("/query")
-async def query_endpoint(
-    request: Request,
-    question: str = Form(...),
-    thread_id: Optional[str] = Form(None),
-    user_file: Optional[UploadFile] = File(None)
-):
-    logger.info("📩 /query endpoint hit")
- 
-    # ----------------------------
-    # 1. Get user ID from JWT
-    # ----------------------------
+#                        QUERY HELPERS
+# ================================================================
+PDF_BLOCK_RE = re.compile(r"\[PDF_DOCUMENT\](.*?)\[/PDF_DOCUMENT\]", re.DOTALL)
+
+
+def get_user_id(request: Request) -> str:
     user = getattr(request.state, "user", None)
     if not user:
         raise HTTPException(status_code=401, detail="Unauthorized")
- 
+
     user_id = user.get("sub")
     if not user_id:
         raise HTTPException(status_code=401, detail="Invalid token")
- 
-    # ----------------------------
-    # 2. Extract file content
-    # ----------------------------
-    extra_context = ""
- 
+
+    return user_id
+
+
+CONSTITUTION_CONTEXT_ARTICLES = int(os.getenv("CONSTITUTION_CONTEXT_ARTICLES", "3"))
+
+
+def constitution_context(question: str) -> str:
+    index = get_constitution_index()
+    if index is None:
+        return ""
+
+    matches = index.search(question, CONSTITUTION_CONTEXT_ARTICLES)
+    if not matches:
+        return ""
+
+    provisions = "\n".join(f"Article {m['article']} ({m['title']}): {m['text']}" for m in matches)
+    return f"\n\nRelevant provisions of the Constitution of India:\n{provisions}"
+
+
+async def build_user_prompt(
+    question: str,
+    user_file: Optional[UploadFile],
+    user_id: str,
+    thread_id: Optional[str],
+    include_constitution: bool = False
+):
+    """
+    Appends the passages of the uploaded file and of any documents attached
+    to the thread that best match the question, within CONTEXT_TOKEN_BUDGET,
+    and optionally the best matching Constitution articles.
+    Returns (prompt, context_key); the key identifies the attached context
+    for the answer cache.
+    """
+    prompt = question
+    if include_constitution:
+        prompt += constitution_context(question)
+
+    documents = []
+    indexes = {}
+
+    if thread_id:
+        attached = await get_thread_documents(thread_id, user_id)
+
+        # Held here so an index cannot be evicted before select_passages uses it;
+        # only documents without one have their (possibly multi-MB) text loaded
+        for doc in attached:
+            index = cached_index(doc["sha256"])
+            if index is not None:
+                indexes[doc["sha256"]] = index
+        missing = [doc["sha256"] for doc in attached if doc["sha256"] not in indexes]
+        texts = await get_thread_document_texts(thread_id, user_id, missing) if missing else {}
+
+        for doc in attached:
+            documents.append((doc["file_name"], doc["sha256"], texts.get(doc["sha256"], "")))
+
     if user_file:
-        with tempfile.NamedTemporaryFile(
-            delete=False,
-            suffix=os.path.splitext(user_file.filename)[1]
-        ) as tmp:
-            content = await user_file.read()
-            tmp.write(content)
-            tmp_path = tmp.name
- 
-        try:
-            file_text = extract_text(tmp_path, user_file.filename)
-            extra_context = f"\n\nUser-provided document context:\n{file_text[:3000]}"
-        finally:
-            os.remove(tmp_path)
- 
-    user_prompt = question + extra_context
- 
-    # ----------------------------
-    # 3. Azure thread management
-    # ----------------------------
+        content = await read_upload(user_file)
+        content_hash = await asyncio.to_thread(document_hash, content)
+        text = await extract_text(content, user_file.filename, content_hash)
+        documents.append((user_file.filename, content_hash, text))
+
+    context_key = ",".join(sorted(content_hash for _, content_hash, _ in documents))
+    if include_constitution:
+        context_key += "+constitution"
+
+    if not documents:
+        return prompt, context_key
+
+    selected = await asyncio.to_thread(select_passages, documents, question, indexes=indexes)
+    sections = [
+        f"\n\nUser-provided document context ({file_name}):\n" + "\n...\n".join(passages)
+        for file_name, passages in selected
+    ]
+    return prompt + "".join(sections), context_key
+
+
+async def start_turn(user_id: str, question: str, thread_id: Optional[str], user_prompt: str) -> dict:
+    """
+    Resolves the Azure thread and posts the user message to the agent.
+    Returns the turn; nothing is written to Mongo until finish_turn (or
+    save_unanswered_turn), which stores both messages in one batch.
+    """
     if thread_id:
-        thread = project_client.agents.threads.get(thread_id=thread_id)
+        thread = await agent_gateway.get_thread(thread_id)
     else:
-        thread = project_client.agents.threads.create()
- 
-    thread_id = thread.id
- 
-    # ----------------------------
-    # 4. Store thread + user message
-    # ----------------------------
-    await get_or_create_thread(thread_id, user_id, question)
- 
-    await save_message(
-        thread_id=thread_id,
-        user_id=user_id,
-        sender="user",
-        message=question
-    )
- 
-    # ----------------------------
-    # 5. Send message to Azure Agent
-    # ----------------------------
-    project_client.agents.messages.create(
-        thread_id=thread_id,
+        thread = await agent_gateway.create_thread()
+
+    turn = new_turn(thread.id, user_id, question)
+
+    await agent_gateway.create_message(
+        thread_id=thread.id,
         role="user",
         content=user_prompt
     )
- 
-    run = project_client.agents.runs.create_and_process(
-        thread_id=thread_id,
-        agent_id=legal_agent.id
-    )
- 
-    if run.status == "failed":
-        raise HTTPException(status_code=500, detail="Agent run failed")
- 
-    # ----------------------------
-    # 6. Read agent reply
-    # ----------------------------
-    messages = project_client.agents.messages.list(
-        thread_id=thread_id,
-        order=ListSortOrder.ASCENDING
-    )
-   
-    reply_text = ""
+
+    return turn
+
+
+async def save_unanswered_turn(turn: dict):
+    """Keeps the user's question in the history when the run fails."""
+    try:
+        await turn_writer.submit(turn)
+    except Exception as e:
+        logger.error(f"Could not save unanswered turn on thread {turn['thread_id']}: {e}")
+
+
+async def finish_turn(turn: dict, reply_text: str) -> dict:
+    """Renders the optional PDF, stores the turn and builds the API response."""
+    thread_id = turn["thread_id"]
     pdf_files = []
- 
-    for msg in messages:
-        if msg.run_id == run.id and getattr(msg, "text_messages", None):
-            reply_text = msg.text_messages[-1].text.value.strip()
-            print("botResponse:::::", reply_text)
- 
-    # ----------------------------
-    # 7. Optional PDF detection
-    # ----------------------------
+
     pdf_content = extract_pdf_block(reply_text)
     if pdf_content:
-        pdf_path = f"generated_{thread_id}.pdf"
-        create_pdf_from_text(pdf_content, pdf_path)
-        pdf_files.append(f"download/{pdf_path}")
- 
-    # ----------------------------
-    # 8. Save agent response
-    # ----------------------------
-    await save_message(
-        thread_id=thread_id,
-        user_id=user_id,
-        sender="agent",
-        message=reply_text
-    )
- 
-    clean_text = re.sub(
-        r"\[PDF_DOCUMENT\](.*?)\[/PDF_DOCUMENT\]",
-        "",
-        reply_text,
-        flags=re.DOTALL
-    ).strip()
- 
-    # ----------------------------
-    # 9. Final response
-    # ----------------------------
+        pdf_id = await create_pdf(pdf_content)
+        pdf_files.append(f"download/{pdf_id}")
+
+    turn["messages"].append(new_message(thread_id, turn["user_id"], "agent", reply_text))
+    await turn_writer.submit(turn)
+
+    clean_text = PDF_BLOCK_RE.sub("", reply_text).strip()
+
     return {
         "answer": clean_text,
         "pdf_files": pdf_files,
         "thread_id": thread_id,
         "status": "success"
     }
- 
- 
\ No newline at end of file
+
+
+# Identical concurrent requests share one run; turns on one thread run one at a time
+query_flights = SingleFlight()
+thread_locks = KeyedLocks()
+
+
+def thread_lock(thread_id: Optional[str]):
+    # A new thread cannot be raced, so only existing threads need the lock
+    return thread_locks.hold(thread_id) if thread_id else contextlib.nullcontext()
+
+
+def deadline_exceeded(e: RunDeadlineExceeded) -> HTTPException:
+    return HTTPException(
+        status_code=504,
+        detail=f"The agent did not answer within {e.deadline_seconds:g} seconds; the run was cancelled"
+    )
+
+
+async def run_query_turn(
+    user_id: str,
+    question: str,
+    thread_id: Optional[str],
+    user_prompt: str,
+    use_cache: bool = False,
+    context_key: str = "",
+    deadline_seconds: Optional[float] = None
+) -> dict:
+    """
+    One full question/answer turn; shared by /query and the job workers.
+    Double-clicks and retries (same user, thread, question and documents)
+    that arrive while the first is running receive that run's result.
+    The agent run is bounded by deadline_seconds (504 when exceeded).
+    """
+    flight_key = (user_id, thread_id or "", question.strip(), context_key)
+
+    async def locked_turn():
+        async with thread_lock(thread_id):
+            return await execute_query_turn(
+                user_id, question, thread_id, user_prompt, use_cache, context_key,
+                resolve_deadline(deadline_seconds)
+            )
+
+    return await query_flights.do(flight_key, locked_turn)
+
+
+async def execute_query_turn(
+    user_id: str,
+    question: str,
+    thread_id: Optional[str],
+    user_prompt: str,
+    use_cache: bool,
+    context_key: str,
+    deadline_seconds: float
+) -> dict:
+    # The cache is shared by all users. A reply on an existing thread can draw
+    # on that thread's earlier messages, so only first turns (question +
+    # attached context alone) are read from or written to it.
+    use_cache = use_cache and thread_id is None
+
+    # ----------------------------
+    # 1. Thread + user message
+    # ----------------------------
+    turn = await start_turn(user_id, question, thread_id, user_prompt)
+    thread_id = turn["thread_id"]
+
+    try:
+        reply_text = await get_turn_reply(
+            question, thread_id, use_cache, context_key, deadline_seconds
+        )
+    except BaseException:
+        await save_unanswered_turn(turn)
+        raise
+
+    # ----------------------------
+    # 4. PDF + save both messages
+    # ----------------------------
+    return await finish_turn(turn, reply_text)
+
+
+async def get_turn_reply(
+    question: str,
+    thread_id: str,
+    use_cache: bool,
+    context_key: str,
+    deadline_seconds: float
+) -> str:
+    cached_reply = answer_cache.get(question, context_key) if use_cache else None
+
+    if cached_reply is not None:
+        # ----------------------------
+        # 2a. Cached answer: no agent run, but keep the Azure thread coherent
+        # ----------------------------
+        await agent_gateway.create_message(
+            thread_id=thread_id,
+            role="assistant",
+            content=cached_reply
+        )
+        return cached_reply
+
+    # ----------------------------
+    # 2. Run the Azure Agent
+    # ----------------------------
+    started = time.monotonic()
+    try:
+        run = await agent_gateway.run_to_completion(
+            thread_id=thread_id,
+            agent_id=legal_agent.id,
+            deadline_seconds=deadline_seconds
+        )
+    except RunDeadlineExceeded as e:
+        raise deadline_exceeded(e)
+
+    if run.status != RunStatus.COMPLETED:
+        raise HTTPException(status_code=500, detail="Agent run failed")
+
+    # ----------------------------
+    # 3. Read agent reply
+    # ----------------------------
+    reply_text = await agent_gateway.get_run_reply(thread_id, run.id)
+    print("botResponse:::::", reply_text)
+
+    if use_cache and reply_text:
+        answer_cache.put(question, reply_text, time.monotonic() - started, context_key)
+
+    return reply_text
+
+
+query_job_queue = QueryJobQueue(
+    run_query_turn,
+    workers=QUERY_JOB_WORKERS,
+    max_pending=QUERY_JOB_MAX_PENDING
+)
+
+# Queue depth for load shedding: runs waiting on the gateway + queued jobs
+rate_limiter.set_load_probe(
+    lambda: agent_gateway.stats()["queued"] + query_job_queue.pending()
+)
+
+
+@app.on_event("startup")
+async def start_query_jobs():
+    query_job_queue.start()
+    turn_writer.start()
+
+
+@app.on_event("shutdown")
+async def stop_query_jobs():
+    # Cancelled jobs and abandoned turns still cancel their Azure runs and
+    # save the unanswered turn on the way out, so they are stopped before
+    # the turn writer, the gateway and the extraction pool
+    await query_job_queue.stop()
+    await query_flights.cancel_all()
+    await turn_writer.close()
+    agent_gateway.shutdown()
+    shutdown_extraction_pool()
+
+
+# ================================================================
+#                           MAIN ENDPOINT
+@app.post("/query", dependencies=[Depends(rate_limit("query"))])
+async def query_endpoint(
+    request: Request,
+    question: str = Form(...),
+    thread_id: Optional[str] = Form(None),
+    user_file: Optional[UploadFile] = File(None),
+    async_mode: bool = Form(False),
+    include_constitution: bool = Form(False),
+    use_cache: bool = Form(False),
+    deadline_seconds: Optional[float] = Form(None)
+):
+    """
+    Runs one agent turn. With async_mode=true the turn is queued on the
+    job workers and a job id is returned immediately (202); poll
+    GET /query/jobs/{job_id} for the result. include_constitution=true adds
+    the best matching Constitution articles to the prompt. use_cache=true
+    answers repeated (or near-duplicate) questions from the answer cache;
+    it only applies to the first turn of a new thread (no thread_id), since
+    the cache is shared across users and later turns depend on the thread.
+    An Idempotency-Key header makes client retries replay the first result.
+    deadline_seconds bounds the agent run (default AGENT_RUN_DEADLINE_SECONDS);
+    past it the run is cancelled and 504 returned. A synchronous request
+    whose client disconnects cancels its run.
+    """
+    logger.info("📩 /query endpoint hit")
+
+    user_id = get_user_id(request)
+
+    # The upload is only readable during this request, so extract it up front
+    user_prompt, context_key = await build_user_prompt(
+        question, user_file, user_id, thread_id, include_constitution
+    )
+
+    async def handle():
+        if async_mode:
+            # The job keeps the caller's concurrency slot until it finishes,
+            # so queued jobs count against the per-user limit too
+            slot_key = hand_off_slot(request)
+            try:
+                job_id = await query_job_queue.submit(
+                    user_id,
+                    on_finish=lambda: rate_limiter.release(slot_key),
+                    question=question,
+                    thread_id=thread_id,
+                    user_prompt=user_prompt,
+                    use_cache=use_cache,
+                    context_key=context_key,
+                    deadline_seconds=deadline_seconds
+                )
+            except BaseException:
+                await rate_limiter.release(slot_key)
+                raise
+            return JSONResponse(
+                status_code=202,
+                content={
+                    "job_id": job_id,
+                    "status": "queued",
+                    "status_url": f"/query/jobs/{job_id}"
+                }
+            )
+
+        # A client that goes away cancels the turn, and with it the Azure run
+        # unless another coalesced request is still waiting for it
+        return await cancel_on_disconnect(
+            request,
+            run_query_turn(
+                user_id, question, thread_id, user_prompt, use_cache, context_key,
+                deadline_seconds
+            )
+        )
+
+    # Retries carrying the same Idempotency-Key replay the first result
+    request_fingerprint = fingerprint(
+        question, thread_id, context_key, async_mode, include_constitution, use_cache
+    )
+    return await run_idempotent(request, user_id, "query", request_fingerprint, handle)
+
+
+@app.get("/query/jobs/{job_id}")
+async def query_job_status(job_id: str, request: Request):
+    user_id = get_user_id(request)
+    return await query_job_queue.get(job_id, user_id)
+
+
+# ================================================================
+#                      STREAMING ENDPOINT (SSE)
+# ================================================================
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.post("/query/stream", dependencies=[Depends(rate_limit("query"))])
+async def query_stream_endpoint(
+    request: Request,
+    question: str = Form(...),
+    thread_id: Optional[str] = Form(None),
+    user_file: Optional[UploadFile] = File(None),
+    include_constitution: bool = Form(False),
+    deadline_seconds: Optional[float] = Form(None)
+):
+    """
+    Same as /query but answers as Server-Sent Events: `delta` events carry
+    text as the agent produces it, then one `done` event carries the final
+    payload (answer, pdf_files, thread_id). Failures arrive as `error`
+    (status_code 504 when the run outlives deadline_seconds). Closing the
+    connection cancels the run.
+    """
+    logger.info("📩 /query/stream endpoint hit")
+
+    user_id = get_user_id(request)
+    user_prompt, _ = await build_user_prompt(
+        question, user_file, user_id, thread_id, include_constitution
+    )
+
+    async def event_source():
+        # Held for the whole turn so a second turn on this thread waits for us
+        async with thread_lock(thread_id):
+            try:
+                turn = await start_turn(user_id, question, thread_id, user_prompt)
+            except HTTPException as e:
+                yield sse_event("error", {"detail": e.detail, "status_code": e.status_code})
+                return
+
+            turn_thread_id = turn["thread_id"]
+            answered = False
+            parts = []
+            try:
+                async for event_type, event_data in agent_gateway.stream_run(
+                    thread_id=turn_thread_id,
+                    agent_id=legal_agent.id,
+                    deadline_seconds=resolve_deadline(deadline_seconds)
+                ):
+                    if isinstance(event_data, MessageDeltaChunk):
+                        delta = event_data.text
+                        if delta:
+                            parts.append(delta)
+                            yield sse_event("delta", {"text": delta})
+
+                    elif isinstance(event_data, ThreadRun) and event_data.status == RunStatus.FAILED:
+                        yield sse_event("error", {"detail": "Agent run failed", "thread_id": turn_thread_id})
+                        return
+
+                    elif event_type == AgentStreamEvent.ERROR:
+                        yield sse_event("error", {"detail": str(event_data), "thread_id": turn_thread_id})
+                        return
+
+                answered = True
+
+            except RunDeadlineExceeded as e:
+                error = deadline_exceeded(e)
+                yield sse_event("error", {
+                    "detail": error.detail,
+                    "status_code": error.status_code,
+                    "thread_id": turn_thread_id
+                })
+                return
+
+            except Exception as e:
+                logger.error(f"Agent stream failed for thread {turn_thread_id}: {e}", exc_info=True)
+                yield sse_event("error", {"detail": "Agent run failed", "thread_id": turn_thread_id})
+                return
+
+            finally:
+                if not answered:
+                    await save_unanswered_turn(turn)
+
+            result = await finish_turn(turn, "".join(parts).strip())
+            yield sse_event("done", result)
+
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -0,0 +1,222 @@
+import os
+import zlib
+import asyncio
+import logging
+from datetime import datetime, timedelta
+
+import bson
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError
+
+from db import chat_threads, chat_messages, DUPLICATE_KEY
+from blob_store import get_blob_store
+from chat_cache import chat_cache
+from search_index import unindex_messages
+from single_flight import SingleFlight
+
+logger = logging.getLogger("archive")
+logger.setLevel(logging.INFO)
+
+
+# ============================================================
+# ENV CONFIG
+# ============================================================
+# Threads without activity for this long move to blob storage (0 disables)
+CHAT_ARCHIVE_AFTER_DAYS = float(os.getenv("CHAT_ARCHIVE_AFTER_DAYS", "180"))
+CHAT_ARCHIVE_INTERVAL_SECONDS = int(os.getenv("CHAT_ARCHIVE_INTERVAL_SECONDS", str(6 * 3600)))
+CHAT_ARCHIVE_BATCH_THREADS = int(os.getenv("CHAT_ARCHIVE_BATCH_THREADS", "100"))
+CHAT_ARCHIVE_CONTAINER = os.getenv("CHAT_ARCHIVE_CONTAINER", "chat-archive")
+
+# A claim older than this belongs to a worker that died mid-archive
+ARCHIVE_CLAIM_SECONDS = 3600
+
+archive_store = get_blob_store(CHAT_ARCHIVE_CONTAINER)
+
+# Concurrent first reads of an archived thread share one rehydration
+_rehydrations = SingleFlight()
+
+
+def archive_blob_name(user_id: str, thread_id: str) -> str:
+    return f"threads/{user_id}/{thread_id}.bson.z"
+
+
+# ============================================================
+# ARCHIVE
+# ============================================================
+async def _claim(thread_id: str, user_id: str, cutoff: datetime):
+    """
+    Marks the thread as being archived unless it is active or already taken.
+    Returns the stored claim time (None if not claimed), which later writes
+    must match to prove the claim is still ours.
+    """
+    now = datetime.utcnow()
+    claimed = await chat_threads.find_one_and_update(
+        {
+            "thread_id": thread_id,
+            "user_id": user_id,
+            "archived": {"$in": [None, False]},
+            "updated_at": {"$lt": cutoff},
+            "rehydrated_at": {"$not": {"$gte": cutoff}},
+            "archive_claimed_at": {"$not": {"$gte": now - timedelta(seconds=ARCHIVE_CLAIM_SECONDS)}}
+        },
+        {"$set": {"archive_claimed_at": now}},
+        projection={"archive_claimed_at": 1},
+        return_document=ReturnDocument.AFTER
+    )
+    return claimed["archive_claimed_at"] if claimed else None
+
+
+async def archive_thread(thread_id: str, user_id: str, cutoff: datetime) -> int:
+    """
+    Moves one idle thread's messages into a single compressed blob of BSON
+    documents (stored exactly as in chat_messages, packed replies included)
+    and leaves the chat_threads document as a stub. Returns messages moved.
+    The stub is only written if the claim still holds and no turn was saved
+    since; otherwise the blob is dropped and the thread stays live.
+    """
+    claimed_at = await _claim(thread_id, user_id, cutoff)
+    if claimed_at is None:
+        return 0
+    ours = {"thread_id": thread_id, "user_id": user_id, "archive_claimed_at": claimed_at}
+
+    try:
+        messages = await chat_messages.find(
+            {"thread_id": thread_id, "user_id": user_id}
+        ).sort("_id", 1).to_list(None)
+
+        name = archive_blob_name(user_id, thread_id)
+        if messages:
+            data = await asyncio.to_thread(
+                lambda: zlib.compress(b"".join(bson.encode(m) for m in messages), 6)
+            )
+            await asyncio.to_thread(archive_store.put, name, data, "application/octet-stream")
+
+        stub = await chat_threads.update_one(
+            {**ours, "updated_at": {"$lt": cutoff}},
+            {
+                "$set": {
+                    "archived": True,
+                    "archived_at": datetime.utcnow(),
+                    "archive_blob": name if messages else None,
+                    "archived_message_count": len(messages)
+                },
+                "$unset": {"archive_claimed_at": "", "rehydrated_at": ""}
+            }
+        )
+    except BaseException:
+        await chat_threads.update_one(ours, {"$unset": {"archive_claimed_at": ""}})
+        raise
+
+    if not stub.matched_count:
+        # A turn was saved (or the claim expired) while we were copying
+        logger.info(f"Thread {thread_id} became active while being archived, leaving it live")
+        if messages:
+            await asyncio.to_thread(archive_store.delete, name)
+        await chat_threads.update_one(ours, {"$unset": {"archive_claimed_at": ""}})
+        return 0
+
+    # Only the archived messages go; anything written meanwhile stays live
+    if messages:
+        await chat_messages.delete_many({"_id": {"$in": [m["_id"] for m in messages]}})
+        await unindex_messages(user_id, messages)
+
+    chat_cache.invalidate_thread(user_id, thread_id)
+    return len(messages)
+
+
+async def archive_idle_threads() -> int:
+    if CHAT_ARCHIVE_AFTER_DAYS <= 0:
+        return 0
+
+    cutoff = datetime.utcnow() - timedelta(days=CHAT_ARCHIVE_AFTER_DAYS)
+
+    # Served by the (archived, updated_at) index
+    candidates = await chat_threads.find(
+        {"archived": {"$in": [None, False]}, "updated_at": {"$lt": cutoff}},
+        {"thread_id": 1, "user_id": 1}
+    ).sort("updated_at", 1).limit(CHAT_ARCHIVE_BATCH_THREADS).to_list(None)
+
+    archived = 0
+    for thread in candidates:
+        try:
+            if await archive_thread(thread["thread_id"], thread["user_id"], cutoff):
+                archived += 1
+        except Exception as e:
+            logger.error(f"Archiving thread {thread['thread_id']} failed: {e}", exc_info=True)
+    return archived
+
+
+async def archive_loop():
+    while True:
+        try:
+            archived = await archive_idle_threads()
+            if archived:
+                logger.info(f"Archived {archived} threads idle for more than {CHAT_ARCHIVE_AFTER_DAYS:g} days")
+        except Exception as e:
+            logger.error(f"Chat archival failed: {e}", exc_info=True)
+        await asyncio.sleep(CHAT_ARCHIVE_INTERVAL_SECONDS)
+
+
+# ============================================================
+# REHYDRATE
+# ============================================================
+async def _rehydrate(thread_id: str, user_id: str, blob_name: str):
+    try:
+        data = await asyncio.to_thread(archive_store.get, blob_name)
+    except Exception:
+        # SingleFlight only coalesces within this process: another worker may
+        # have restored the thread and deleted the blob since we read the stub
+        still_archived = await chat_threads.find_one(
+            {"thread_id": thread_id, "user_id": user_id, "archived": True},
+            {"_id": 1}
+        )
+        if not still_archived:
+            return
+        raise
+    messages = await asyncio.to_thread(lambda: bson.decode_all(zlib.decompress(data)))
+
+    if messages:
+        # Picked up again by the search indexer
+        for msg in messages:
+            msg["search_pending"] = True
+        try:
+            await chat_messages.insert_many(messages, ordered=False)
+        except BulkWriteError as e:
+            # Left over from an archive that stopped before deleting them
+            if any(err["code"] != DUPLICATE_KEY for err in e.details["writeErrors"]):
+                raise
+
+    await chat_threads.update_one(
+        {"thread_id": thread_id, "user_id": user_id},
+        {
+            "$set": {"rehydrated_at": datetime.utcnow()},
+            "$unset": {"archived": "", "archived_at": "", "archive_blob": "", "archived_message_count": ""}
+        }
+    )
+    await asyncio.to_thread(archive_store.delete, blob_name)
+
+    chat_cache.invalidate_thread(user_id, thread_id)
+    logger.info(f"Rehydrated {len(messages)} messages of thread {thread_id}")
+
+
+async def ensure_thread_loaded(thread_id: str, user_id: str):
+    """Brings an archived thread's messages back into chat_messages before a read."""
+    thread = await chat_threads.find_one(
+        {"thread_id": thread_id, "user_id": user_id, "archived": True},
+        {"archive_blob": 1}
+    )
+    if not thread:
+        return
+
+    if not thread.get("archive_blob"):
+        # Archived with no messages; nothing to restore
+        await chat_threads.update_one(
+            {"_id": thread["_id"]},
+            {"$set": {"rehydrated_at": datetime.utcnow()}, "$unset": {"archived": "", "archived_at": ""}}
+        )
+        return
+
+    await _rehydrations.do(
+        (user_id, thread_id),
+        lambda: _rehydrate(thread_id, user_id, thread["archive_blob"])
+    )
@@ -3,7 +3,6 @@ import logging
 from typing import Dict, List
 from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from starlette.middleware.base import BaseHTTPMiddleware
 from starlette.responses import JSONResponse
 from jwt import ExpiredSignatureError, InvalidTokenError
 from .jwt_service import JWTService
@@ -25,13 +24,35 @@ bearer = HTTPBearer(auto_error=False)
 jwt_service = JWTService()
 
 
-class JWTMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
+class JWTMiddleware:
+    """
+    Verifies the bearer token (if any) and stores its claims on request.state.
+    A plain ASGI middleware rather than a BaseHTTPMiddleware: behind the latter
+    the endpoint's request.is_disconnected() never turns True once the body
+    has been read, so abandoned /query runs could not be cancelled.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        request = Request(scope)
         logger.debug(f"Incoming request: {request.method} {request.url}")
 
+        response_started = False
+
+        async def tracked_send(message):
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
         try:
             if request.method == "OPTIONS":
-                return await call_next(request)
+                return await self.app(scope, receive, send)
             creds: HTTPAuthorizationCredentials = await bearer(request)
             if creds:
                 logger.debug("Authorization header detected, verifying token...")
@@ -53,28 +74,33 @@ class JWTMiddleware(BaseHTTPMiddleware):
 
                 except FastAPIHTTPException as e:
                     logger.warning(f"Token verification failed (HTTPException): {e.detail}")
-                    return JSONResponse(status_code=e.status_code, content={"detail": e.detail})
+                    response = JSONResponse(status_code=e.status_code, content={"detail": e.detail})
+                    return await response(scope, receive, send)
 
                 except Exception as e:
                     logger.error(f"Unexpected error verifying token: {e}", exc_info=True)
-                    return JSONResponse(
+                    response = JSONResponse(
                         status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                         content={"detail": "Error verifying access token"}
                     )
+                    return await response(scope, receive, send)
 
             else:
                 logger.debug("No Authorization header found; continuing as guest.")
 
-            response = await call_next(request)
+            await self.app(scope, receive, tracked_send)
             logger.debug("Request processed successfully.")
-            return response
 
         except Exception as e:
             logger.critical(f"Unhandled exception in JWT middleware: {e}", exc_info=True)
-            return JSONResponse(
+            if response_started:
+                # Too late for an error response; let the server close the connection
+                raise
+            response = JSONResponse(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 content={"detail": "Internal server error in authentication middleware"}
             )
+            await response(scope, receive, send)
 
 
 
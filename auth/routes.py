@@ -1,8 +1,9 @@
-from fastapi import APIRouter, Response, Request, HTTPException, status
+from fastapi import APIRouter, Depends, Response, Request, HTTPException, status
 from fastapi.responses import HTMLResponse
 from .models import SignUpRequestDTO, UserDTO,SignUpResponse, ForgotPasswordDTO, ResetPasswordDTO, LoginDTO, LoginResponseDTO, VerifyOtpDTO, ResendOtpDTO
 from .services import AuthService
 from .utils import verify_captcha
+from rate_limit import rate_limit
 import os
 
 
@@ -10,7 +11,7 @@ router = APIRouter(prefix="/auth", tags=["Auth"])
 
 
 # Signup
-@router.post("/signup", response_model=SignUpResponse, status_code=status.HTTP_201_CREATED)
+@router.post("/signup", response_model=SignUpResponse, status_code=status.HTTP_201_CREATED, dependencies=[Depends(rate_limit("otp"))])
 async def signup(data: SignUpRequestDTO):
     # await verify_captcha(data.captcha_token)
     await AuthService.sign_up(data)   # <-- MUST await because it's async
@@ -24,7 +25,7 @@ async def verify_signup(data: VerifyOtpDTO):
 
 
 
-@router.post("/login", status_code=202)
+@router.post("/login", status_code=202, dependencies=[Depends(rate_limit("otp"))])
 async def login(data: LoginDTO):
     # await verify_captcha(data.captcha_token)
     result = await AuthService.login(data)
@@ -40,7 +41,7 @@ async def verify_login(data: VerifyOtpDTO, response: Response):
     return LoginResponseDTO(access_token=tokens["access_token"],)
 
 
-@router.post("/login/resend-otp", status_code=202)
+@router.post("/login/resend-otp", status_code=202, dependencies=[Depends(rate_limit("otp"))])
 async def resend_otp(payload: ResendOtpDTO):
     try:
         await AuthService.resend_otp(payload)
@@ -62,7 +63,7 @@ async def refresh(request: Request):
 
 
 # Forgot password
-@router.post("/forgot-password", status_code=status.HTTP_200_OK)
+@router.post("/forgot-password", status_code=status.HTTP_200_OK, dependencies=[Depends(rate_limit("otp"))])
 async def forgot_password(data: ForgotPasswordDTO):
     await AuthService.forgot_password(data)
     return {"message": "OTP sent to your email."}
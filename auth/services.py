@@ -5,6 +5,7 @@ import string
 import time
 import bcrypt
 from fastapi import HTTPException, status
+from pymongo.errors import DuplicateKeyError
 
 from typing import List, Optional, Dict, Any
 
@@ -70,6 +71,9 @@ class AuthService:
 
         except HTTPException:
             raise
+        except DuplicateKeyError:
+            # Concurrent sign-up with the same email (unique index user_email)
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Email already registered")
         except Exception as e:
             logger.exception("Error in sign_up")
             raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Internal server error during signup")
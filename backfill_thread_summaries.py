@@ -0,0 +1,41 @@
+"""
+One-off: fills message_count, last_message_preview, last_sender and a real
+updated_at on chat threads created before those fields were maintained.
+Every thread not yet marked with summary_version is recounted, including
+ones that got new turns (and so a partial message_count) since the deploy.
+Safe to re-run; marked threads are skipped.
+
+    python backfill_thread_summaries.py
+"""
+import asyncio
+import logging
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from db import chat_threads
+from history import backfill_thread_summary, THREAD_SUMMARY_VERSION
+
+logger = logging.getLogger("backfill_thread_summaries")
+logging.basicConfig(level=logging.INFO)
+
+
+async def main():
+    updated = 0
+    cursor = chat_threads.find(
+        # Archived threads have no messages in chat_messages to count
+        {"summary_version": {"$not": {"$gte": THREAD_SUMMARY_VERSION}}, "archived": {"$ne": True}},
+        {"thread_id": 1, "user_id": 1, "updated_at": 1}
+    )
+    async for thread in cursor:
+        await backfill_thread_summary(thread)
+        updated += 1
+        if updated % 500 == 0:
+            logger.info(f"Backfilled {updated} threads")
+
+    logger.info(f"Done, backfilled {updated} threads")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,158 @@
+import os
+import logging
+import tempfile
+from datetime import datetime, timezone
+from typing import Iterator, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger("blob_store")
+logger.setLevel(logging.INFO)
+
+
+# ============================================================
+# ENV CONFIG
+# ============================================================
+BLOB_CONN_STR = os.getenv("AZURE_STORAGE_CONNECTION_STRING")
+
+# Used instead of Azure Blob Storage when no connection string is configured
+LOCAL_BLOB_ROOT = os.getenv(
+    "LOCAL_BLOB_ROOT",
+    os.path.join(tempfile.gettempdir(), "legal_blobs")
+)
+
+CHUNK_SIZE = 256 * 1024
+
+
+# ============================================================
+# STORES
+# ============================================================
+# Both stores expose the same small synchronous API; async callers run it
+# through asyncio.to_thread. Names are "/"-separated paths inside the store.
+class AzureBlobStore:
+    def __init__(self, container_client):
+        self._container = container_client
+
+    def exists(self, name: str) -> bool:
+        return self._container.get_blob_client(name).exists()
+
+    def put(self, name: str, data: bytes, content_type: Optional[str] = None):
+        from azure.storage.blob import ContentSettings
+
+        settings = ContentSettings(content_type=content_type) if content_type else None
+        self._container.get_blob_client(name).upload_blob(
+            data, overwrite=True, content_settings=settings
+        )
+
+    def get(self, name: str) -> bytes:
+        return self._container.get_blob_client(name).download_blob().readall()
+
+    def size(self, name: str) -> Optional[int]:
+        from azure.core.exceptions import ResourceNotFoundError
+
+        try:
+            return self._container.get_blob_client(name).get_blob_properties().size
+        except ResourceNotFoundError:
+            return None
+
+    def iter_range(self, name: str, start: int, end: int) -> Iterator[bytes]:
+        """Yields bytes start..end (inclusive) without buffering the whole blob."""
+        downloader = self._container.get_blob_client(name).download_blob(
+            offset=start, length=end - start + 1
+        )
+        yield from downloader.chunks()
+
+    def delete(self, name: str):
+        from azure.core.exceptions import ResourceNotFoundError
+
+        try:
+            self._container.get_blob_client(name).delete_blob()
+        except ResourceNotFoundError:
+            pass
+
+    def list(self, prefix: str) -> List[Tuple[str, datetime]]:
+        return [
+            (blob.name, blob.last_modified)
+            for blob in self._container.list_blobs(name_starts_with=prefix)
+        ]
+
+
+class LocalBlobStore:
+    def __init__(self, root: str):
+        self._root = os.path.abspath(root)
+        os.makedirs(self._root, exist_ok=True)
+
+    def _path(self, name: str) -> str:
+        path = os.path.abspath(os.path.join(self._root, name))
+        if not path.startswith(self._root + os.sep):
+            raise ValueError(f"Invalid blob name: {name}")
+        return path
+
+    def exists(self, name: str) -> bool:
+        return os.path.isfile(self._path(name))
+
+    def put(self, name: str, data: bytes, content_type: Optional[str] = None):
+        path = self._path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def get(self, name: str) -> bytes:
+        with open(self._path(name), "rb") as f:
+            return f.read()
+
+    def size(self, name: str) -> Optional[int]:
+        try:
+            return os.path.getsize(self._path(name))
+        except FileNotFoundError:
+            return None
+
+    def iter_range(self, name: str, start: int, end: int) -> Iterator[bytes]:
+        with open(self._path(name), "rb") as f:
+            f.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = f.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+
+    def delete(self, name: str):
+        try:
+            os.remove(self._path(name))
+        except FileNotFoundError:
+            pass
+
+    def list(self, prefix: str) -> List[Tuple[str, datetime]]:
+        results = []
+        for dirpath, _, filenames in os.walk(self._root):
+            for filename in filenames:
+                if filename.endswith(".tmp"):
+                    continue
+                path = os.path.join(dirpath, filename)
+                name = os.path.relpath(path, self._root).replace(os.sep, "/")
+                if name.startswith(prefix):
+                    modified = datetime.fromtimestamp(os.path.getmtime(path), tz=timezone.utc)
+                    results.append((name, modified))
+        return results
+
+
+def get_blob_store(container_name: str):
+    """Azure container when a connection string is configured, else a local directory."""
+    if BLOB_CONN_STR:
+        from azure.storage.blob import BlobServiceClient
+
+        container = BlobServiceClient.from_connection_string(BLOB_CONN_STR).get_container_client(container_name)
+        try:
+            container.create_container()
+        except Exception:
+            pass
+        return AzureBlobStore(container)
+
+    logger.warning(f"AZURE_STORAGE_CONNECTION_STRING not set, storing '{container_name}' blobs locally")
+    return LocalBlobStore(os.path.join(LOCAL_BLOB_ROOT, container_name))
@@ -0,0 +1,137 @@
+import os
+import json
+import time
+import hashlib
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+
+from fastapi.encoders import jsonable_encoder
+
+# ============================================================
+# ENV CONFIG
+# ============================================================
+CHAT_CACHE_MAX_USERS = int(os.getenv("CHAT_CACHE_MAX_USERS", "2000"))
+CHAT_CACHE_MAX_PAGES_PER_USER = int(os.getenv("CHAT_CACHE_MAX_PAGES_PER_USER", "32"))
+
+# Writes invalidate this worker's entries immediately; the TTL bounds how
+# long another worker (which did not see the write) can serve a stale page.
+CHAT_CACHE_TTL_SECONDS = float(os.getenv("CHAT_CACHE_TTL_SECONDS", "30"))
+
+
+class CachedPage(NamedTuple):
+    body: bytes
+    etag: str
+    next_cursor: Optional[str]
+    expires_at: float
+
+
+def render_page(docs) -> bytes:
+    """Serializes like FastAPI's JSONResponse, once, so hits skip encoding."""
+    return json.dumps(
+        jsonable_encoder(docs),
+        ensure_ascii=False,
+        allow_nan=False,
+        separators=(",", ":")
+    ).encode("utf-8")
+
+
+def page_etag(body: bytes) -> str:
+    return '"' + hashlib.sha1(body).hexdigest() + '"'
+
+
+# ============================================================
+# CACHE
+# ============================================================
+class ChatReadCache:
+    """
+    Per-user LRU of rendered /chat/threads and /chat/messages pages.
+    Keys are ("threads", params...) or ("messages", thread_id, params...),
+    so a write can drop exactly the user's thread lists and the pages of
+    the thread it touched.
+    """
+
+    def __init__(self, max_users: int, max_pages_per_user: int, ttl_seconds: float):
+        self._users: "OrderedDict[str, OrderedDict]" = OrderedDict()
+        self._max_users = max_users
+        self._max_pages = max_pages_per_user
+        self._ttl = ttl_seconds
+
+        # Bumped by every invalidation; a page loaded across one is not stored
+        self.version = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, user_id: str, key: tuple) -> Optional[CachedPage]:
+        pages = self._users.get(user_id)
+        page = pages.get(key) if pages is not None else None
+
+        if page is None or page.expires_at < time.monotonic():
+            if page is not None:
+                del pages[key]
+            self.misses += 1
+            return None
+
+        self._users.move_to_end(user_id)
+        pages.move_to_end(key)
+        self.hits += 1
+        return page
+
+    def put(
+        self,
+        user_id: str,
+        key: tuple,
+        body: bytes,
+        next_cursor: Optional[str],
+        loaded_at_version: int
+    ) -> CachedPage:
+        page = CachedPage(body, page_etag(body), next_cursor, time.monotonic() + self._ttl)
+        if loaded_at_version != self.version:
+            # A write landed while this page was being read; it may be stale
+            return page
+
+        pages = self._users.get(user_id)
+        if pages is None:
+            pages = self._users[user_id] = OrderedDict()
+            if len(self._users) > self._max_users:
+                self._users.popitem(last=False)
+        self._users.move_to_end(user_id)
+
+        pages[key] = page
+        pages.move_to_end(key)
+        if len(pages) > self._max_pages:
+            pages.popitem(last=False)
+        return page
+
+    def invalidate_threads(self, user_id: str):
+        """The user's thread list changed (new turn, documents attached...)."""
+        self._drop(user_id, lambda key: key[0] == "threads")
+
+    def invalidate_thread(self, user_id: str, thread_id: str):
+        """A thread got new messages: its pages and the thread lists are stale."""
+        self._drop(
+            user_id,
+            lambda key: key[0] == "threads" or (key[0] == "messages" and key[1] == thread_id)
+        )
+
+    def _drop(self, user_id: str, stale):
+        self.version += 1
+        pages = self._users.get(user_id)
+        if not pages:
+            return
+        for key in [k for k in pages if stale(k)]:
+            del pages[key]
+            self.invalidations += 1
+
+    def stats(self) -> dict:
+        return {
+            "users": len(self._users),
+            "pages": sum(len(p) for p in self._users.values()),
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+        }
+
+
+chat_cache = ChatReadCache(CHAT_CACHE_MAX_USERS, CHAT_CACHE_MAX_PAGES_PER_USER, CHAT_CACHE_TTL_SECONDS)
@@ -1,49 +1,287 @@
-from fastapi import APIRouter, Request, HTTPException
+import asyncio
+from typing import Awaitable, Callable, List, Literal, Optional
+from fastapi import APIRouter, Request, Response, HTTPException, UploadFile, File, Query
+from fastapi.responses import StreamingResponse
 from bson import ObjectId
 from db import chat_messages, chat_threads
+from extraction import extract_document
+from text_cache import document_hash
+from history import attach_document, detach_document
+from uploads import read_upload
+from pagination import (
+    keyset_page, parse_cursor, parse_fields,
+    DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, NEXT_CURSOR_HEADER
+)
+from chat_cache import chat_cache, render_page
+from message_store import rehydrate_messages, STORAGE_FIELDS
+from search_index import search_messages
+from export_service import export_ndjson, export_pdf
+from archive import ensure_thread_loaded
 router = APIRouter(prefix="/chat", tags=["Chat"])
 
+THREAD_FIELDS = {
+    "thread_id", "title", "created_at", "updated_at", "documents",
+    "last_message_preview", "last_sender", "message_count", "archived"
+}
+MESSAGE_FIELDS = {"thread_id", "sender", "message", "created_at"}
+
+
+async def cached_page(request: Request, user_id: str, key: tuple, load: Callable[[], Awaitable]):
+    """
+    Serves a page from the per-user read cache, loading and rendering it on
+    a miss. Every page carries an ETag; a matching If-None-Match gets 304.
+    """
+    page = chat_cache.get(user_id, key)
+    if page is None:
+        version = chat_cache.version
+        docs, next_cursor = await load()
+        page = chat_cache.put(user_id, key, render_page(docs), next_cursor, version)
+
+    # Clients must revalidate every time; unchanged pages cost a 304
+    headers = {"ETag": page.etag, "Cache-Control": "private, no-cache"}
+    if page.next_cursor:
+        headers[NEXT_CURSOR_HEADER] = page.next_cursor
+
+    if_none_match = request.headers.get("if-none-match", "")
+    if page.etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+
+    return Response(content=page.body, media_type="application/json", headers=headers)
+
+
 @router.get("/threads")
-async def get_user_threads(request: Request):
+async def get_user_threads(
+    request: Request,
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    fields: Optional[str] = None
+):
+    """
+    A page of the user's threads, most recently active first. Each thread
+    carries its last_message_preview, last_sender and message_count, so the
+    sidebar needs no per-thread message queries. Pass the X-Next-Cursor
+    response header back as `before` for older threads (or as `after` when
+    paging with `after`). `fields=thread_id,title` returns only those fields.
+    """
     user = request.state.user
     if not user:
         raise HTTPException(status_code=401, detail="Unauthorized")
 
     user_id = user.get("sub")
 
-    # SAFE: _id is always indexed in Cosmos
-    cursor = chat_threads.find(
-        {"user_id": user_id}
-    ).sort("_id", -1)
+    before_cursor = parse_cursor(before, "before", "updated_at")
+    after_cursor = parse_cursor(after, "after", "updated_at")
+    # Without ?fields, still only the API fields (not bookkeeping like counted_turns)
+    projection = parse_fields(fields, THREAD_FIELDS) or {f: 1 for f in THREAD_FIELDS | {"user_id"}}
 
-    threads = []
-    async for doc in cursor:
-        doc["_id"] = str(doc["_id"])
-        threads.append(doc)
+    # Served by the (user_id, updated_at, _id) index
+    def load():
+        return keyset_page(
+            chat_threads,
+            {"user_id": user_id},
+            before=before_cursor,
+            after=after_cursor,
+            limit=limit,
+            projection=projection,
+            sort_field="updated_at"
+        )
 
-    return threads
+    key = ("threads", before, after, limit, fields)
+    return await cached_page(request, user_id, key, load)
 
 
 # ===============================
 # GET THREAD MESSAGES
 # ===============================
 @router.get("/messages/{thread_id}")
-async def get_thread_messages(thread_id: str, request: Request):
+async def get_thread_messages(
+    thread_id: str,
+    request: Request,
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    fields: Optional[str] = None,
+    preview_chars: Optional[int] = Query(None, ge=1, le=2000)
+):
+    """
+    A page of the thread's messages, newest first; paging works as for
+    /chat/threads. preview_chars cuts each message to that many characters
+    in the database, so long agent replies are not transferred in full.
+    Both endpoints are cached per user and answer If-None-Match with 304.
+    """
+    user = request.state.user
+    if not user:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+    user_id = user.get("sub")
+
+    projection = parse_fields(fields, MESSAGE_FIELDS)
+    if preview_chars:
+        # Large replies keep a MESSAGE_PREVIEW_CHARS prefix inline, so the
+        # preview never needs their compressed / offloaded full text
+        if projection is None:
+            projection = {f: 1 for f in MESSAGE_FIELDS}
+        if "message" in projection:
+            projection["message"] = {"$substrCP": ["$message", 0, preview_chars]}
+    elif projection and "message" in projection:
+        projection.update({f: 1 for f in STORAGE_FIELDS})
+
+    before_cursor = parse_cursor(before, "before")
+    after_cursor = parse_cursor(after, "after")
+
+    # Served by the (thread_id, user_id, _id) index
+    async def load():
+        # Archived threads are restored on first read
+        await ensure_thread_loaded(thread_id, user_id)
+        messages, next_cursor = await keyset_page(
+            chat_messages,
+            {"thread_id": thread_id, "user_id": user_id},
+            before=before_cursor,
+            after=after_cursor,
+            limit=limit,
+            projection=projection
+        )
+        return await rehydrate_messages(messages), next_cursor
+
+    key = ("messages", thread_id, before, after, limit, fields, preview_chars)
+    return await cached_page(request, user_id, key, load)
+
+
+# ===============================
+# EXPORT
+# ===============================
+@router.get("/threads/{thread_id}/export")
+async def export_thread(
+    thread_id: str,
+    request: Request,
+    format: Literal["ndjson", "pdf"] = "ndjson"
+):
+    """
+    Downloads the whole thread, oldest message first, streamed from the
+    Mongo cursor: NDJSON (one message per line) or a paginated PDF (413
+    past EXPORT_PDF_MAX_PAGES pages; NDJSON has no limit).
+    """
+    user = request.state.user
+    if not user:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+    user_id = user.get("sub")
+
+    thread = await chat_threads.find_one(
+        {"thread_id": thread_id, "user_id": user_id},
+        {"title": 1}
+    )
+    if not thread:
+        raise HTTPException(status_code=404, detail="Thread not found")
+
+    await ensure_thread_loaded(thread_id, user_id)
+
+    if format == "pdf":
+        body = await export_pdf(thread_id, user_id, thread.get("title") or "Conversation")
+        media_type = "application/pdf"
+    else:
+        body = export_ndjson(thread_id, user_id)
+        media_type = "application/x-ndjson"
+
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="thread-{thread_id}.{format}"'}
+    )
+
+
+# ===============================
+# SEARCH
+# ===============================
+@router.get("/search")
+async def search_chat_history(
+    request: Request,
+    q: str = Query(..., min_length=1, max_length=500),
+    thread_id: Optional[str] = None,
+    offset: int = Query(0, ge=0, le=1000),
+    limit: int = Query(20, ge=1, le=50)
+):
+    """
+    Ranked (BM25) search over the user's own messages, optionally within one
+    thread. Each result has a snippet around the first matching term; page
+    with offset/limit.
+    """
+    user = request.state.user
+    if not user:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+    user_id = user.get("sub")
+
+    return await search_messages(user_id, q, offset=offset, limit=limit, thread_id=thread_id)
+
+
+# ===============================
+# THREAD DOCUMENTS
+# ===============================
+@router.post("/threads/{thread_id}/documents")
+async def attach_thread_documents(
+    thread_id: str,
+    request: Request,
+    files: List[UploadFile] = File(...)
+):
+    """
+    Attaches documents to a thread once; every later /query on the thread
+    gets their text as context without re-uploading.
+    """
     user = request.state.user
     if not user:
         raise HTTPException(status_code=401, detail="Unauthorized")
 
     user_id = user.get("sub")
 
-    # ✅ SAFE: sorting by _id instead of created_at
-    cursor = chat_messages.find({
-        "thread_id": thread_id,
-        "user_id": user_id
-    }).sort("_id", 1)
+    attached = []
+    for upload in files:
+        content = await read_upload(upload)
+        if not content:
+            raise HTTPException(status_code=400, detail=f"Empty file: {upload.filename}")
+
+        # Hashing up to UPLOAD_MAX_BYTES is too slow for the event loop; done once
+        content_hash = await asyncio.to_thread(document_hash, content)
+        text = await extract_document(content, upload.filename, content_hash=content_hash)
+        summary = await attach_document(
+            thread_id, user_id, upload.filename, content_hash, text
+        )
+        if summary is None:
+            raise HTTPException(status_code=404, detail="Thread not found")
+
+        attached.append(summary)
+
+    return {"status": "success", "thread_id": thread_id, "documents": attached}
+
+
+@router.get("/threads/{thread_id}/documents")
+async def list_thread_documents(thread_id: str, request: Request):
+    user = request.state.user
+    if not user:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+    user_id = user.get("sub")
+
+    thread = await chat_threads.find_one(
+        {"thread_id": thread_id, "user_id": user_id},
+        {"documents": 1}
+    )
+    if not thread:
+        raise HTTPException(status_code=404, detail="Thread not found")
+
+    return list((thread.get("documents") or {}).values())
+
+
+@router.delete("/threads/{thread_id}/documents/{sha256}")
+async def delete_thread_document(thread_id: str, sha256: str, request: Request):
+    user = request.state.user
+    if not user:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+    user_id = user.get("sub")
 
-    messages = []
-    async for msg in cursor:
-        msg["_id"] = str(msg["_id"])
-        messages.append(msg)
+    if not await detach_document(thread_id, user_id, sha256):
+        raise HTTPException(status_code=404, detail="Document not found")
 
-    return messages
\ No newline at end of file
+    return {"status": "success", "thread_id": thread_id, "sha256": sha256}
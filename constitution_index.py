@@ -0,0 +1,296 @@
+"""
+Article/clause-level search index over the bundled Constitution of India PDF.
+
+Build once (done in the Docker image and the App Service workflow; the
+app also builds it on startup when the file is missing):
+
+    python constitution_index.py
+
+The index is a single little-endian binary file that is memory-mapped
+read-only, so every worker process shares the same page-cache copy:
+
+    header    magic, version, counts, average unit length, section offsets
+    units     per clause: article / title / text string refs + token length
+    terms     sorted by term bytes: string ref + postings range
+    postings  (unit_id, term_frequency) pairs
+    strings   utf-8 blob referenced by (offset, length)
+"""
+import os
+import re
+import sys
+import mmap
+import math
+import heapq
+import struct
+import logging
+import threading
+from array import array
+from collections import Counter
+from typing import List, Optional
+
+from passages import tokenize
+
+logger = logging.getLogger("constitution_index")
+logger.setLevel(logging.INFO)
+
+
+# ============================================================
+# ENV CONFIG
+# ============================================================
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+CONSTITUTION_PDF_PATH = os.getenv(
+    "CONSTITUTION_PDF_PATH",
+    os.path.join(BASE_DIR, "Indian Constitution_merged.pdf")
+)
+CONSTITUTION_INDEX_PATH = os.getenv(
+    "CONSTITUTION_INDEX_PATH",
+    os.path.join(BASE_DIR, "constitution.idx")
+)
+
+MAGIC = b"CONIDX01"
+VERSION = 1
+HEADER = struct.Struct("<8s9I")
+UNIT_FIELDS = 7
+TERM_FIELDS = 4
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+# ============================================================
+# PDF PARSING (build time only)
+# ============================================================
+# The merged PDF also carries the Penal Code; only the Constitution body
+# (Preamble up to the First Schedule) is indexed.
+BODY_START_RE = re.compile(r"THE CONSTITUTION OF\s+INDIA\s*\n\s*PREAMBLE")
+BODY_END_RE = re.compile(r"\(First Schedule\)")
+RUNNING_HEADER_RE = re.compile(r"^\s*(THE CONSTITUTION OF\s+INDIA|\(Part [^)]*\)|\d{1,4})\s*$")
+ARTICLE_RE = re.compile(
+    r"^(?:\d+\[)?(\d{1,3}[A-Z]{0,3})\.\s+([A-Z\[][^—\n]{2,160}(?:\n[^—\n]{1,160})?)—",
+    re.M
+)
+CLAUSE_RE = re.compile(r"^(?:\d+\[)?\((\d{1,2}[A-Z]?)\)\s", re.M)
+
+
+def _body_text(pdf_path: str) -> str:
+    import fitz
+
+    lines = []
+    started = False
+    with fitz.open(pdf_path) as pdf:
+        for page in pdf:
+            text = page.get_text()
+            if not started:
+                if not BODY_START_RE.search(text):
+                    continue
+                started = True
+            if BODY_END_RE.search(text[:200]):
+                break
+            lines.extend(l.rstrip() for l in text.split("\n") if not RUNNING_HEADER_RE.match(l))
+    return "\n".join(lines)
+
+
+def _parse_units(text: str):
+    """Yields (article, title, clause_text) for the Preamble and every article clause."""
+    articles = []
+    last = 0
+    for m in ARTICLE_RE.finditer(text):
+        number = int(re.match(r"\d+", m.group(1)).group())
+        # Article numbers only move forward; anything else is a numbered list item
+        if number < last or number > last + 30:
+            continue
+        last = number
+        articles.append((m.group(1), " ".join(m.group(2).split()).rstrip("."), m.start()))
+
+    if articles:
+        yield "Preamble", "Preamble", " ".join(text[:articles[0][2]].split())
+
+    for i, (article, title, start) in enumerate(articles):
+        end = articles[i + 1][2] if i + 1 < len(articles) else len(text)
+        body = text[start:end]
+
+        starts = [m.start() for m in CLAUSE_RE.finditer(body)]
+        if not starts or starts[0] > 0:
+            starts.insert(0, 0)
+        for j, clause_start in enumerate(starts):
+            clause_end = starts[j + 1] if j + 1 < len(starts) else len(body)
+            clause_text = " ".join(body[clause_start:clause_end].split())
+            if clause_text:
+                yield article, title, clause_text
+
+
+# ============================================================
+# BUILD
+# ============================================================
+def build_index(pdf_path: str = CONSTITUTION_PDF_PATH, out_path: str = CONSTITUTION_INDEX_PATH) -> int:
+    strings = bytearray()
+    string_refs = {}
+
+    def ref(s: str):
+        if s not in string_refs:
+            data = s.encode("utf-8")
+            string_refs[s] = (len(strings), len(data))
+            strings.extend(data)
+        return string_refs[s]
+
+    units = array("I")
+    postings_by_term = {}
+
+    for unit_id, (article, title, clause_text) in enumerate(_parse_units(_body_text(pdf_path))):
+        # Titles are repeated on every clause so "right to education" finds all of 21A
+        terms = Counter(tokenize(f"{article} {title} {clause_text}"))
+        for term, tf in terms.items():
+            postings_by_term.setdefault(term, []).append((unit_id, tf))
+
+        units.extend(ref(article) + ref(title) + ref(clause_text) + (sum(terms.values()),))
+
+    n_units = len(units) // UNIT_FIELDS
+    avg_length = sum(units[i * UNIT_FIELDS + 6] for i in range(n_units)) / max(n_units, 1)
+
+    terms = array("I")
+    postings = array("I")
+    for term in sorted(postings_by_term, key=lambda t: t.encode("utf-8")):
+        plist = postings_by_term[term]
+        terms.extend(ref(term) + (len(postings) // 2, len(plist)))
+        for unit_id, tf in plist:
+            postings.extend((unit_id, tf))
+
+    off_units = HEADER.size
+    off_terms = off_units + len(units) * 4
+    off_postings = off_terms + len(terms) * 4
+    off_strings = off_postings + len(postings) * 4
+
+    header = HEADER.pack(
+        MAGIC, VERSION, n_units, len(terms) // TERM_FIELDS, int(avg_length * 1000),
+        off_units, off_terms, off_postings, off_strings, len(strings)
+    )
+
+    # Per process: several workers may build on first startup at once
+    tmp_path = f"{out_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(header)
+        f.write(units.tobytes())
+        f.write(terms.tobytes())
+        f.write(postings.tobytes())
+        f.write(strings)
+    os.replace(tmp_path, out_path)
+
+    logger.info(f"Built constitution index: {n_units} clauses, {len(terms) // TERM_FIELDS} terms -> {out_path}")
+    return n_units
+
+
+# ============================================================
+# READER
+# ============================================================
+class ConstitutionIndex:
+    """Read-only view over a memory-mapped index file."""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        (magic, version, self.n_units, self.n_terms, avg_milli,
+         off_units, off_terms, off_postings, off_strings, strings_len) = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a constitution index v{VERSION}")
+
+        self.avg_length = avg_milli / 1000 or 1.0
+        view = memoryview(self._mm)
+        self._units = view[off_units:off_terms].cast("I")
+        self._terms = view[off_terms:off_postings].cast("I")
+        self._postings = view[off_postings:off_strings].cast("I")
+        self._strings = view[off_strings:off_strings + strings_len]
+
+    def _string(self, offset: int, length: int) -> str:
+        return str(self._strings[offset:offset + length], "utf-8")
+
+    def _find_term(self, term: bytes) -> Optional[int]:
+        lo, hi = 0, self.n_terms
+        while lo < hi:
+            mid = (lo + hi) // 2
+            base = mid * TERM_FIELDS
+            offset, length = self._terms[base], self._terms[base + 1]
+            candidate = self._strings[offset:offset + length].tobytes()
+            if candidate < term:
+                lo = mid + 1
+            elif candidate > term:
+                hi = mid
+            else:
+                return mid
+        return None
+
+    def unit(self, unit_id: int) -> dict:
+        base = unit_id * UNIT_FIELDS
+        u = self._units[base:base + UNIT_FIELDS]
+        return {
+            "article": self._string(u[0], u[1]),
+            "title": self._string(u[2], u[3]),
+            "text": self._string(u[4], u[5]),
+        }
+
+    def search(self, query: str, limit: int = 10) -> List[dict]:
+        scores = {}
+        for term in set(tokenize(query)):
+            term_no = self._find_term(term.encode("utf-8"))
+            if term_no is None:
+                continue
+
+            base = term_no * TERM_FIELDS
+            start, count = self._terms[base + 2], self._terms[base + 3]
+            idf = math.log(1 + (self.n_units - count + 0.5) / (count + 0.5))
+
+            for i in range(start * 2, (start + count) * 2, 2):
+                unit_id, tf = self._postings[i], self._postings[i + 1]
+                length = self._units[unit_id * UNIT_FIELDS + 6]
+                norm = 1 - BM25_B + BM25_B * length / self.avg_length
+                scores[unit_id] = scores.get(unit_id, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * norm)
+
+        top = heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+        return [dict(self.unit(unit_id), score=round(score, 4)) for unit_id, score in top]
+
+
+_index: Optional[ConstitutionIndex] = None
+_index_lock = threading.Lock()
+_load_failed = False
+
+
+def get_index() -> Optional[ConstitutionIndex]:
+    """Maps the index on first use; returns None when it has not been built."""
+    global _index, _load_failed
+    if _index is not None or _load_failed:
+        return _index
+
+    with _index_lock:
+        if _index is None and not _load_failed:
+            try:
+                _index = ConstitutionIndex(CONSTITUTION_INDEX_PATH)
+                logger.info(f"Loaded constitution index ({_index.n_units} clauses)")
+            except (OSError, ValueError) as e:
+                _load_failed = True
+                logger.warning(f"Constitution index unavailable, run constitution_index.py: {e}")
+    return _index
+
+
+def ensure_index() -> Optional[ConstitutionIndex]:
+    """
+    Maps the index, building it from the bundled PDF first when the file is
+    missing (a deploy that skipped the build step). Slow; run off the loop.
+    """
+    global _load_failed
+    if not os.path.exists(CONSTITUTION_INDEX_PATH) and os.path.exists(CONSTITUTION_PDF_PATH):
+        logger.info(f"Constitution index missing, building {CONSTITUTION_INDEX_PATH}")
+        try:
+            build_index()
+        except Exception as e:
+            logger.error(f"Building the constitution index failed: {e}", exc_info=True)
+            return None
+        with _index_lock:
+            # Lookups made while building found no file; let the next one map it
+            _load_failed = False
+    return get_index()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    build_index(*sys.argv[1:3])
@@ -0,0 +1,20 @@
+from fastapi import APIRouter, HTTPException, Query
+
+from constitution_index import get_index
+
+router = APIRouter(prefix="/constitution", tags=["Constitution"])
+
+
+@router.get("/search")
+def search_constitution(
+    q: str = Query(..., min_length=2),
+    limit: int = Query(10, ge=1, le=50)
+):
+    index = get_index()
+    if index is None:
+        raise HTTPException(status_code=503, detail="Constitution index is not available")
+
+    return {
+        "query": q,
+        "results": index.search(q, limit)
+    }
@@ -6,5 +6,21 @@ MONGO_URI = os.getenv("MONGO_URI")
 client = AsyncIOMotorClient(MONGO_URI)
 db = client["Legal"]  # database name
 
+# Mongo error code for a unique index violation (e.g. a retried insert of
+# the same _id, or two upserts racing to create one document)
+DUPLICATE_KEY = 11000
+
 chat_threads = db.chat_threads
 chat_messages = db.chat_messages
+thread_documents = db.thread_documents
+
+# Full-text search over chat history (see search_index.py)
+chat_postings = db.chat_postings
+chat_search_stats = db.chat_search_stats
+
+query_jobs = db.query_jobs
+idempotency_keys = db.idempotency_keys
+
+# Accounts live in the auth database (auth/db.py uses the sync driver);
+# this handle is only for startup index management
+users = client[os.getenv("MONGO_DB_NAME", "Legal_Assistance")].users
@@ -0,0 +1,39 @@
+import os
+import asyncio
+import logging
+
+from fastapi import HTTPException, Request
+
+logger = logging.getLogger("disconnect")
+logger.setLevel(logging.INFO)
+
+
+# ============================================================
+# ENV CONFIG
+# ============================================================
+# How often a waiting request checks whether its client has gone away
+DISCONNECT_POLL_SECONDS = float(os.getenv("DISCONNECT_POLL_SECONDS", "1"))
+
+
+# ============================================================
+# CANCEL ON DISCONNECT
+# ============================================================
+async def cancel_on_disconnect(request: Request, awaitable, poll_seconds: float = DISCONNECT_POLL_SECONDS):
+    """
+    Awaits the work while watching the connection. When the client
+    disconnects the work is cancelled and 499 raised. Relies on
+    request.is_disconnected(), so every middleware in front of the route
+    must be plain ASGI (a BaseHTTPMiddleware hides the disconnect).
+    """
+    task = asyncio.ensure_future(awaitable)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=poll_seconds)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                logger.info("Client disconnected, abandoning request")
+                raise HTTPException(status_code=499, detail="Client closed request")
+    finally:
+        if not task.done():
+            task.cancel()
@@ -0,0 +1,72 @@
+import re
+import asyncio
+
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse, Response
+
+from pdf_service import pdf_store, pdf_blob_name, PDF_ID_RE
+
+router = APIRouter(tags=["Downloads"])
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def parse_range(header: str, size: int):
+    """Returns (start, end) inclusive for a single byte range, or None if unsatisfiable."""
+    match = RANGE_RE.match(header.strip())
+    if not match or (not match.group(1) and not match.group(2)):
+        return None
+
+    if not match.group(1):
+        # Suffix range: last N bytes
+        length = int(match.group(2))
+        if length == 0:
+            return None
+        return max(size - length, 0), size - 1
+
+    start = int(match.group(1))
+    end = int(match.group(2)) if match.group(2) else size - 1
+    if start >= size or end < start:
+        return None
+    return start, min(end, size - 1)
+
+
+@router.get("/download/{pdf_id}")
+async def download_pdf(pdf_id: str, request: Request):
+    pdf_id = pdf_id.removesuffix(".pdf")
+    if not PDF_ID_RE.match(pdf_id):
+        raise HTTPException(status_code=404, detail="File not found")
+
+    name = pdf_blob_name(pdf_id)
+    size = await asyncio.to_thread(pdf_store.size, name)
+    if size is None:
+        raise HTTPException(status_code=404, detail="File not found")
+
+    headers = {
+        "Accept-Ranges": "bytes",
+        "Content-Disposition": f'attachment; filename="{pdf_id[:16]}.pdf"',
+        # Content-addressed, so the bytes behind an id never change
+        "Cache-Control": "private, max-age=31536000, immutable",
+        "ETag": f'"{pdf_id}"',
+    }
+
+    range_header = request.headers.get("range")
+    if range_header:
+        byte_range = parse_range(range_header, size)
+        if byte_range is None:
+            return Response(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+        start, end = byte_range
+        status_code = 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    else:
+        start, end = 0, size - 1
+        status_code = 200
+
+    headers["Content-Length"] = str(end - start + 1)
+
+    return StreamingResponse(
+        pdf_store.iter_range(name, start, end),
+        status_code=status_code,
+        media_type="application/pdf",
+        headers=headers
+    )
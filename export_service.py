@@ -0,0 +1,109 @@
+import os
+import json
+import asyncio
+import tempfile
+from typing import AsyncIterator, Iterator, List
+
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+
+from db import chat_messages
+from message_store import rehydrate_messages
+from pdf_service import TextPdfWriter
+
+# ============================================================
+# ENV CONFIG
+# ============================================================
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "100"))
+
+# A PDF export is assembled in memory up to this size, then on disk
+EXPORT_SPOOL_MAX_BYTES = int(os.getenv("EXPORT_SPOOL_MAX_BYTES", str(8 * 1024 * 1024)))
+
+# reportlab holds every page of a PDF in memory until it is saved, so
+# longer threads are only exported as NDJSON
+EXPORT_PDF_MAX_PAGES = int(os.getenv("EXPORT_PDF_MAX_PAGES", "1000"))
+
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+MESSAGE_FIELDS = {"_id": 1, "thread_id": 1, "sender": 1, "message": 1, "created_at": 1,
+                  "message_z": 1, "message_blob": 1, "message_encoding": 1}
+
+
+async def message_batches(thread_id: str, user_id: str) -> AsyncIterator[List[dict]]:
+    """The thread's messages oldest first, EXPORT_BATCH_SIZE at a time, rehydrated."""
+    cursor = chat_messages.find(
+        {"thread_id": thread_id, "user_id": user_id},
+        MESSAGE_FIELDS
+    ).sort("_id", 1).batch_size(EXPORT_BATCH_SIZE)
+
+    batch = []
+    async for msg in cursor:
+        batch.append(msg)
+        if len(batch) >= EXPORT_BATCH_SIZE:
+            yield await rehydrate_messages(batch)
+            batch = []
+    if batch:
+        yield await rehydrate_messages(batch)
+
+
+# ============================================================
+# NDJSON
+# ============================================================
+async def export_ndjson(thread_id: str, user_id: str) -> AsyncIterator[bytes]:
+    """One JSON object per line, streamed batch by batch from the cursor."""
+    async for batch in message_batches(thread_id, user_id):
+        lines = []
+        for msg in batch:
+            msg["_id"] = str(msg["_id"])
+            lines.append(json.dumps(jsonable_encoder(msg), ensure_ascii=False))
+        yield ("\n".join(lines) + "\n").encode("utf-8")
+
+
+# ============================================================
+# PDF
+# ============================================================
+def _format_message(msg: dict) -> str:
+    created_at = msg.get("created_at")
+    stamp = created_at.strftime("%Y-%m-%d %H:%M UTC") if created_at else ""
+    sender = "You" if msg.get("sender") == "user" else "Assistant"
+    return f"{sender} - {stamp}\n{msg.get('message') or ''}\n\n"
+
+
+def _read_chunks(spool) -> Iterator[bytes]:
+    try:
+        spool.seek(0)
+        while True:
+            chunk = spool.read(EXPORT_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        spool.close()
+
+
+async def export_pdf(thread_id: str, user_id: str, title: str) -> Iterator[bytes]:
+    """
+    Lays the messages out page by page as batches arrive from the cursor.
+    A PDF's cross-reference table is only known once every page exists, so
+    the document is written to a spooled file (memory, then disk) and the
+    returned iterator streams that file in chunks. The pages themselves stay
+    in memory until then, hence the 413 past EXPORT_PDF_MAX_PAGES.
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_MAX_BYTES)
+    try:
+        writer = TextPdfWriter(spool)
+        writer.write(f"{title}\n\n")
+        async for batch in message_batches(thread_id, user_id):
+            text = "".join(_format_message(msg) for msg in batch)
+            await asyncio.to_thread(writer.write, text)
+            if writer.pages > EXPORT_PDF_MAX_PAGES:
+                raise HTTPException(
+                    status_code=413,
+                    detail=f"Thread is longer than {EXPORT_PDF_MAX_PAGES} PDF pages; export it with format=ndjson"
+                )
+        await asyncio.to_thread(writer.close)
+    except BaseException:
+        spool.close()
+        raise
+
+    return _read_chunks(spool)
@@ -0,0 +1,343 @@
+import os
+import io
+import math
+import signal
+import asyncio
+import logging
+import threading
+import multiprocessing
+from typing import Optional
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_EXCEPTION
+from concurrent.futures.process import BrokenProcessPool
+
+import fitz
+import docx
+from fastapi import HTTPException
+
+from text_cache import text_cache, document_hash
+
+logger = logging.getLogger("extraction")
+logger.setLevel(logging.INFO)
+
+
+# ============================================================
+# ENV CONFIG
+# ============================================================
+EXTRACT_WORKERS = int(os.getenv("EXTRACT_WORKERS", str(os.cpu_count() or 2)))
+
+# Minimum pages handed to one worker; large PDFs are split into ranges of at least this size.
+EXTRACT_PAGES_PER_CHUNK = int(os.getenv("EXTRACT_PAGES_PER_CHUNK", "25"))
+
+# Per-document page limit
+EXTRACT_MAX_PAGES = int(os.getenv("EXTRACT_MAX_PAGES", "1000"))
+
+# Parse time allowed per pool task, counted from when a worker starts it
+# (time spent queued behind other documents does not count)
+EXTRACT_TIMEOUT_SECONDS = float(os.getenv("EXTRACT_TIMEOUT_SECONDS", "60"))
+
+# How long a document may wait for a free worker before 503
+EXTRACT_QUEUE_TIMEOUT_SECONDS = float(os.getenv("EXTRACT_QUEUE_TIMEOUT_SECONDS", "120"))
+
+# Extra CPU seconds after which a worker stuck inside MuPDF's C code (where
+# the timeout cannot interrupt it) is killed outright
+EXTRACT_KILL_GRACE_SECONDS = 15
+
+
+# ============================================================
+# WORKER FUNCTIONS (run inside the process pool)
+# ============================================================
+class ExtractionTimeout(Exception):
+    """A pool task ran past EXTRACT_TIMEOUT_SECONDS."""
+
+
+def _on_deadline(signum, frame):
+    raise ExtractionTimeout()
+
+
+def _run_with_deadline(fn, args):
+    """
+    Runs one task under its own deadline, so an overrunning parse fails
+    alone and the worker (and every other task on the pool) carries on.
+    SIGALRM interrupts Python code between pages; if the parse is stuck in
+    C, SIGPROF's default action ends the worker instead.
+    """
+    signal.signal(signal.SIGALRM, _on_deadline)
+    signal.setitimer(signal.ITIMER_REAL, EXTRACT_TIMEOUT_SECONDS)
+    signal.setitimer(signal.ITIMER_PROF, EXTRACT_TIMEOUT_SECONDS + EXTRACT_KILL_GRACE_SECONDS)
+    try:
+        return fn(*args)
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.setitimer(signal.ITIMER_PROF, 0)
+
+
+def _pdf_page_count(data: bytes) -> int:
+    # In the pool too: opening an untrusted PDF is what can crash MuPDF
+    with fitz.open(stream=data, filetype="pdf") as pdf:
+        return pdf.page_count
+
+
+def _parse_pdf_pages(data: bytes, start: int, end: int, mode: str) -> str:
+    with fitz.open(stream=data, filetype="pdf") as pdf:
+        return "".join(pdf[i].get_text(mode) for i in range(start, end))
+
+
+def _parse_docx(data: bytes, separator: str) -> str:
+    document = docx.Document(io.BytesIO(data))
+    return separator.join(p.text for p in document.paragraphs)
+
+
+# ============================================================
+# PROCESS POOL
+# ============================================================
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn: the API process runs threads (SDK executor, Mongo), which fork does not copy safely
+            _pool = ProcessPoolExecutor(
+                max_workers=EXTRACT_WORKERS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _pool
+
+
+def _reset_pool(pool: ProcessPoolExecutor):
+    """
+    Drops a pool so the next extraction starts a fresh one. A pool whose
+    worker died (segfault/OOM on a hostile file) is unusable for good.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def shutdown_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+# ============================================================
+# PLANNING
+# ============================================================
+def _file_ext(filename: str) -> str:
+    return filename.lower().rsplit(".", 1)[-1]
+
+
+def _needs_parsing(filename: str) -> bool:
+    return _file_ext(filename) in ["pdf", "doc", "docx"]
+
+
+def _plan_tasks(data: bytes, filename: str, mode: str, page_count: int = 0):
+    """
+    Returns the list of (fn, args) pool tasks for a document that
+    _needs_parsing; PDFs need their page_count (counted on the pool).
+    """
+    ext = _file_ext(filename)
+
+    if ext == "pdf":
+        if page_count > EXTRACT_MAX_PAGES:
+            raise HTTPException(
+                status_code=413,
+                detail=f"Document has {page_count} pages, limit is {EXTRACT_MAX_PAGES}"
+            )
+
+        # Never more ranges than workers: every range ships its own copy of the bytes
+        chunk = max(EXTRACT_PAGES_PER_CHUNK, math.ceil(page_count / EXTRACT_WORKERS))
+        return [
+            (_parse_pdf_pages, (data, start, min(start + chunk, page_count), mode))
+            for start in range(0, page_count, chunk)
+        ]
+
+    if ext in ["doc", "docx"]:
+        separator = "<br>" if mode == "html" else "\n"
+        return [(_parse_docx, (data, separator))]
+
+
+def _inline_text(data: bytes, filename: str) -> str:
+    if _file_ext(filename) == "txt":
+        return data.decode("utf-8", errors="ignore")
+    return ""
+
+
+def _parse_error(filename: str, e: Exception) -> HTTPException:
+    kind = "PDF" if _file_ext(filename) == "pdf" else "DOCX"
+    return HTTPException(status_code=500, detail=f"Error processing {kind}: {e}")
+
+
+def _timeout_error() -> HTTPException:
+    return HTTPException(
+        status_code=504,
+        detail=f"Document extraction exceeded {EXTRACT_TIMEOUT_SECONDS:g}s"
+    )
+
+
+def _busy_error() -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail="Document extraction is busy, retry later"
+    )
+
+
+# ============================================================
+# CACHE
+# ============================================================
+def _cache_key(data: bytes, filename: str, mode: str, content_hash: Optional[str] = None) -> str:
+    return text_cache.key(content_hash or document_hash(data), f"{_file_ext(filename)}-{mode}")
+
+
+def _cache_lookup(data: bytes, filename: str, mode: str, content_hash: Optional[str] = None):
+    key = _cache_key(data, filename, mode, content_hash)
+    return key, text_cache.get(key)
+
+
+# ============================================================
+# PUBLIC API
+# ============================================================
+async def extract_document(
+    data: bytes,
+    filename: str,
+    mode: str = "text",
+    content_hash: Optional[str] = None
+) -> str:
+    """
+    Extracts text from an uploaded document without blocking the event loop.
+    PDFs are split into page ranges parsed in parallel on the process pool.
+    mode="html" keeps PyMuPDF's HTML output and joins DOCX paragraphs with <br>.
+    Results are cached by content hash, so re-uploads skip parsing; pass
+    content_hash (document_hash(data)) when the caller already has it.
+    """
+    key, text = await asyncio.to_thread(_cache_lookup, data, filename, mode, content_hash)
+    if text is not None:
+        return text
+
+    text = await _extract_async(data, filename, mode)
+    await asyncio.to_thread(text_cache.put, key, text)
+    return text
+
+
+def extract_document_sync(data: bytes, filename: str, mode: str = "text") -> str:
+    """Blocking variant of extract_document for sync (threadpool) routes."""
+    key, text = _cache_lookup(data, filename, mode)
+    if text is not None:
+        return text
+
+    text = _extract_sync(data, filename, mode)
+    text_cache.put(key, text)
+    return text
+
+
+async def _run_on_pool(pool: ProcessPoolExecutor, tasks) -> list:
+    loop = asyncio.get_running_loop()
+    try:
+        futures = [loop.run_in_executor(pool, _run_with_deadline, fn, args) for fn, args in tasks]
+    except RuntimeError as e:
+        # Shut down by a concurrent reset between _get_pool and here
+        raise BrokenProcessPool(str(e))
+
+    # Each task bounds its own run time; this only bounds the wait for a
+    # worker. Tasks that have not started are cancelled, running ones end
+    # under their own deadline.
+    return await asyncio.wait_for(
+        asyncio.gather(*futures),
+        EXTRACT_QUEUE_TIMEOUT_SECONDS + EXTRACT_TIMEOUT_SECONDS
+    )
+
+
+def _run_on_pool_sync(pool: ProcessPoolExecutor, tasks) -> list:
+    try:
+        futures = [pool.submit(_run_with_deadline, fn, args) for fn, args in tasks]
+    except RuntimeError as e:
+        raise BrokenProcessPool(str(e))
+
+    done, not_done = wait(
+        futures,
+        timeout=EXTRACT_QUEUE_TIMEOUT_SECONDS + EXTRACT_TIMEOUT_SECONDS,
+        return_when=FIRST_EXCEPTION
+    )
+    for future in not_done:
+        future.cancel()
+
+    for future in done:
+        if future.exception() is not None:
+            raise future.exception()
+
+    if not_done:
+        raise TimeoutError()
+
+    return [future.result() for future in futures]
+
+
+async def _run_tasks(tasks, filename: str) -> list:
+    # One retry on a fresh pool when a worker died; a file that kills the
+    # worker again is reported as unparseable
+    for attempt in range(2):
+        pool = _get_pool()
+        try:
+            return await _run_on_pool(pool, tasks)
+        except BrokenProcessPool as e:
+            _reset_pool(pool)
+            if attempt:
+                raise _parse_error(filename, e)
+            logger.warning(f"Extraction pool broken while parsing {filename}, retrying on a new pool")
+        except ExtractionTimeout:
+            raise _timeout_error()
+        except asyncio.TimeoutError:
+            raise _busy_error()
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise _parse_error(filename, e)
+
+
+def _run_tasks_sync(tasks, filename: str) -> list:
+    for attempt in range(2):
+        pool = _get_pool()
+        try:
+            return _run_on_pool_sync(pool, tasks)
+        except BrokenProcessPool as e:
+            _reset_pool(pool)
+            if attempt:
+                raise _parse_error(filename, e)
+            logger.warning(f"Extraction pool broken while parsing {filename}, retrying on a new pool")
+        except ExtractionTimeout:
+            raise _timeout_error()
+        except TimeoutError:
+            raise _busy_error()
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise _parse_error(filename, e)
+
+
+async def _extract_async(data: bytes, filename: str, mode: str) -> str:
+    if not _needs_parsing(filename):
+        return _inline_text(data, filename)
+
+    page_count = 0
+    if _file_ext(filename) == "pdf":
+        page_count, = await _run_tasks([(_pdf_page_count, (data,))], filename)
+
+    tasks = _plan_tasks(data, filename, mode, page_count)
+    return "".join(await _run_tasks(tasks, filename))
+
+
+def _extract_sync(data: bytes, filename: str, mode: str) -> str:
+    if not _needs_parsing(filename):
+        return _inline_text(data, filename)
+
+    page_count = 0
+    if _file_ext(filename) == "pdf":
+        page_count, = _run_tasks_sync([(_pdf_page_count, (data,))], filename)
+
+    tasks = _plan_tasks(data, filename, mode, page_count)
+    return "".join(_run_tasks_sync(tasks, filename))
@@ -1,27 +1,236 @@
+import os
+import asyncio
 from datetime import datetime
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
 from db import chat_threads
 from db import chat_messages
+from db import thread_documents
+from db import DUPLICATE_KEY
+from chat_cache import chat_cache
+from message_store import pack_messages
 
-async def get_or_create_thread(thread_id: str, user_id: str, question: str):
-    thread = await chat_threads.find_one({
-        "thread_id": thread_id,
-        "user_id": user_id
-    })
+# ===============================
+# TURN PERSISTENCE
+# ===============================
+# A turn is {"thread_id", "user_id", "title", "messages": [...]}; its messages
+# get their _id and created_at when created, so writing them later (batched
+# or write-behind) keeps the order they happened in. They are stored with
+# search_pending; search_index.index_loop indexes them off the request path.
 
-    if not thread:
-        await chat_threads.insert_one({
-            "thread_id": thread_id,
-            "user_id": user_id,
-            "title": question[:50],
-            "created_at": datetime.utcnow(),
-            "updated_at": datetime.utcnow()
-        })
-        
-async def save_message(thread_id, user_id, sender, message):
-    await chat_messages.insert_one({
+# Length of chat_threads.last_message_preview (the sidebar snippet)
+THREAD_PREVIEW_CHARS = int(os.getenv("THREAD_PREVIEW_CHARS", "120"))
+
+
+def new_message(thread_id, user_id, sender, message):
+    return {
+        "_id": ObjectId(),
         "thread_id": thread_id,
         "user_id": user_id,
         "sender": sender,
         "message": message,
-        "created_at": datetime.utcnow()
-    })
\ No newline at end of file
+        "created_at": datetime.utcnow(),
+        "search_pending": True
+    }
+
+
+def new_turn(thread_id, user_id, question):
+    return {
+        "thread_id": thread_id,
+        "user_id": user_id,
+        "title": question[:50],
+        "messages": [new_message(thread_id, user_id, "user", question)]
+    }
+
+
+def message_preview(message) -> str:
+    text = " ".join((message or "").split())
+    if len(text) <= THREAD_PREVIEW_CHARS:
+        return text
+    return text[:THREAD_PREVIEW_CHARS - 1].rstrip() + "…"
+
+
+# Ids of the latest turns counted into message_count, kept on the thread so a
+# retried write (write-behind flush) does not count the same turn twice
+COUNTED_TURNS_KEPT = 50
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def _thread_updates(turns):
+    """
+    One upsert per thread that keeps the denormalized summary (updated_at,
+    message_count, last_message_preview, last_sender) in step with the
+    messages. Each turn is identified by its first message's _id; turns
+    already in counted_turns are not counted again, so replaying a batch
+    is a no-op. Written as an update pipeline so every field is computed
+    from the document as it was before this write; user text goes in as
+    $literal so a leading "$" is not read as a field path.
+    """
+    grouped = {}
+    for turn in turns:
+        grouped.setdefault((turn["thread_id"], turn["user_id"]), []).append(turn)
+
+    updates = []
+    for (thread_id, user_id), thread_turns in grouped.items():
+        first = thread_turns[0]["messages"][0]
+        last = thread_turns[-1]["messages"][-1]
+        counted = {"$ifNull": ["$counted_turns", []]}
+
+        def is_new(turn):
+            return {"$not": [{"$in": [turn["messages"][0]["_id"], counted]}]}
+
+        is_latest = {"$gte": [last["created_at"], {"$ifNull": ["$updated_at", EPOCH]}]}
+
+        updates.append(UpdateOne(
+            {"thread_id": thread_id, "user_id": user_id},
+            [{"$set": {
+                "title": {"$ifNull": ["$title", {"$literal": thread_turns[0]["title"]}]},
+                "created_at": {"$ifNull": ["$created_at", first["created_at"]]},
+                "last_message_preview": {
+                    "$cond": [is_latest, {"$literal": message_preview(last["message"])}, "$last_message_preview"]
+                },
+                "last_sender": {"$cond": [is_latest, {"$literal": last["sender"]}, "$last_sender"]},
+                "updated_at": {"$max": ["$updated_at", last["created_at"]]},
+                "message_count": {"$add": [{"$ifNull": ["$message_count", 0]}] + [
+                    {"$cond": [is_new(turn), len(turn["messages"]), 0]} for turn in thread_turns
+                ]},
+                "counted_turns": {"$slice": [
+                    {"$concatArrays": [counted] + [
+                        {"$cond": [is_new(turn), [turn["messages"][0]["_id"]], []]} for turn in thread_turns
+                    ]},
+                    -COUNTED_TURNS_KEPT
+                ]}
+            }}],
+            upsert=True
+        ))
+    return updates
+
+
+async def _insert_messages(messages):
+    messages = await pack_messages(messages)
+    try:
+        await chat_messages.insert_many(messages, ordered=False)
+    except BulkWriteError as e:
+        # Messages carry their own _id, so a duplicate is a retried write that already landed
+        if any(err["code"] != DUPLICATE_KEY for err in e.details["writeErrors"]):
+            raise
+
+
+async def _update_threads(updates):
+    try:
+        await chat_threads.bulk_write(updates, ordered=False)
+    except BulkWriteError as e:
+        errors = e.details["writeErrors"]
+        if any(err["code"] != DUPLICATE_KEY for err in errors):
+            raise
+        # Lost concurrent upsert races: the threads exist now, so retrying matches them
+        await chat_threads.bulk_write([updates[err["index"]] for err in errors], ordered=False)
+
+
+async def save_turns(turns):
+    """
+    Persists any number of turns in two concurrent round-trips: one
+    insert_many for all messages and one bulk_write of thread upserts.
+    """
+    turns = [t for t in turns if t["messages"]]
+    if not turns:
+        return
+
+    messages = [m for t in turns for m in t["messages"]]
+    await asyncio.gather(
+        _insert_messages(messages),
+        _update_threads(_thread_updates(turns))
+    )
+
+    for turn in turns:
+        chat_cache.invalidate_thread(turn["user_id"], turn["thread_id"])
+
+
+async def attach_document(thread_id, user_id, file_name, content_hash, text):
+    """
+    Stores extracted document text for a thread. The text lives in
+    thread_documents; chat_threads keeps a small summary keyed by hash.
+    Returns None when the thread does not belong to the user.
+    """
+    thread = await chat_threads.find_one(
+        {"thread_id": thread_id, "user_id": user_id},
+        {"_id": 1}
+    )
+    if not thread:
+        return None
+
+    now = datetime.utcnow()
+    await thread_documents.update_one(
+        {"thread_id": thread_id, "user_id": user_id, "sha256": content_hash},
+        {"$set": {"file_name": file_name, "text": text, "attached_at": now}},
+        upsert=True
+    )
+
+    summary = {
+        "sha256": content_hash,
+        "file_name": file_name,
+        "chars": len(text),
+        "attached_at": now
+    }
+    await chat_threads.update_one(
+        {"thread_id": thread_id, "user_id": user_id},
+        {"$set": {f"documents.{content_hash}": summary}}
+    )
+    chat_cache.invalidate_threads(user_id)
+    return summary
+
+
+async def detach_document(thread_id, user_id, content_hash):
+    result = await thread_documents.delete_one(
+        {"thread_id": thread_id, "user_id": user_id, "sha256": content_hash}
+    )
+    await chat_threads.update_one(
+        {"thread_id": thread_id, "user_id": user_id},
+        {"$unset": {f"documents.{content_hash}": ""}}
+    )
+    chat_cache.invalidate_threads(user_id)
+    return result.deleted_count > 0
+
+
+async def get_thread_documents(thread_id, user_id):
+    """Returns the attached documents of a thread (file_name, sha256), oldest first, without their text."""
+    cursor = thread_documents.find(
+        {"thread_id": thread_id, "user_id": user_id},
+        {"_id": 0, "file_name": 1, "sha256": 1}
+    ).sort("attached_at", 1)
+    return [doc async for doc in cursor]
+
+
+async def get_thread_document_texts(thread_id, user_id, hashes) -> dict:
+    """Extracted text of some of a thread's documents, by sha256."""
+    cursor = thread_documents.find(
+        {"thread_id": thread_id, "user_id": user_id, "sha256": {"$in": list(hashes)}},
+        {"_id": 0, "sha256": 1, "text": 1}
+    )
+    return {doc["sha256"]: doc["text"] async for doc in cursor}
+
+
+# Marks threads whose summary was recomputed from their messages by the backfill
+THREAD_SUMMARY_VERSION = 1
+
+
+async def backfill_thread_summary(thread):
+    """
+    Recomputes the denormalized summary of a thread from its messages. Threads
+    written before it was maintained may already have a partial message_count
+    (turns since the deploy), so the count is taken from chat_messages.
+    """
+    query = {"thread_id": thread["thread_id"], "user_id": thread["user_id"]}
+    count = await chat_messages.count_documents(query)
+    last = await chat_messages.find_one(query, {"sender": 1, "message": 1, "created_at": 1}, sort=[("_id", -1)])
+
+    summary = {"message_count": count, "summary_version": THREAD_SUMMARY_VERSION}
+    if last:
+        summary.update({
+            "last_message_preview": message_preview(last.get("message")),
+            "last_sender": last.get("sender"),
+            "updated_at": max(last["created_at"], thread.get("updated_at") or last["created_at"])
+        })
+    await chat_threads.update_one({"_id": thread["_id"]}, {"$set": summary})
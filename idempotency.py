@@ -0,0 +1,124 @@
+import os
+import json
+import hashlib
+import logging
+from datetime import datetime, timedelta
+
+from fastapi import HTTPException, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pymongo.errors import DuplicateKeyError
+
+from db import idempotency_keys
+
+logger = logging.getLogger("idempotency")
+logger.setLevel(logging.INFO)
+
+
+# ============================================================
+# ENV CONFIG
+# ============================================================
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+
+# How long a stored result is replayed for retries (Mongo TTL index)
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", str(24 * 3600)))
+
+# An in-progress record older than this is assumed abandoned (crashed worker)
+IDEMPOTENCY_LOCK_SECONDS = int(os.getenv("IDEMPOTENCY_LOCK_SECONDS", "600"))
+
+
+def fingerprint(*parts) -> str:
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part if isinstance(part, bytes) else str(part).encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+# ============================================================
+# CLAIM / COMPLETE
+# ============================================================
+async def _claim(record_id: str, request_fingerprint: str):
+    """Returns None when this request owns the key, else the existing record."""
+    now = datetime.utcnow()
+    try:
+        await idempotency_keys.insert_one({
+            "_id": record_id,
+            "fingerprint": request_fingerprint,
+            "status": "in_progress",
+            "created_at": now
+        })
+        return None
+    except DuplicateKeyError:
+        pass
+
+    # Take over a record left behind by a crashed request
+    stale = await idempotency_keys.find_one_and_update(
+        {
+            "_id": record_id,
+            "status": "in_progress",
+            "created_at": {"$lt": now - timedelta(seconds=IDEMPOTENCY_LOCK_SECONDS)}
+        },
+        {"$set": {"fingerprint": request_fingerprint, "created_at": now}}
+    )
+    if stale:
+        return None
+
+    return await idempotency_keys.find_one({"_id": record_id})
+
+
+def _replay(record: dict) -> JSONResponse:
+    return JSONResponse(
+        status_code=record["status_code"],
+        content=record["body"],
+        headers={"Idempotent-Replayed": "true"}
+    )
+
+
+async def run_idempotent(request: Request, user_id: str, scope: str, request_fingerprint: str, handler):
+    """
+    Runs handler() once per (user, scope, Idempotency-Key). Retries with the
+    same key get the stored response replayed; a retry while the first call
+    is still running gets 409. Without the header the handler just runs.
+    Failed calls are not stored, so they can be retried with the same key.
+    """
+    key = request.headers.get(IDEMPOTENCY_HEADER)
+    if not key:
+        return await handler()
+
+    if len(key) > 255:
+        raise HTTPException(status_code=400, detail=f"{IDEMPOTENCY_HEADER} is too long")
+
+    record_id = f"{user_id}:{scope}:{key}"
+    existing = await _claim(record_id, request_fingerprint)
+
+    if existing is not None:
+        if existing.get("fingerprint") != request_fingerprint:
+            raise HTTPException(
+                status_code=422,
+                detail=f"{IDEMPOTENCY_HEADER} was already used for a different request"
+            )
+        if existing.get("status") == "completed":
+            logger.info(f"Replaying stored response for {scope} key {key}")
+            return _replay(existing)
+        raise HTTPException(
+            status_code=409,
+            detail=f"A request with this {IDEMPOTENCY_HEADER} is still in progress"
+        )
+
+    try:
+        result = await handler()
+    except BaseException:
+        await idempotency_keys.delete_one({"_id": record_id})
+        raise
+
+    if isinstance(result, JSONResponse):
+        status_code, body = result.status_code, json.loads(result.body)
+    else:
+        status_code, body = 200, jsonable_encoder(result)
+
+    await idempotency_keys.update_one(
+        {"_id": record_id},
+        {"$set": {"status": "completed", "status_code": status_code, "body": body}}
+    )
+    return result
@@ -0,0 +1,113 @@
+import os
+import logging
+
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import OperationFailure
+
+from db import (
+    chat_threads, chat_messages, thread_documents, chat_postings,
+    query_jobs, idempotency_keys, users
+)
+from idempotency import IDEMPOTENCY_TTL_SECONDS
+
+logger = logging.getLogger("indexes")
+logger.setLevel(logging.INFO)
+
+
+# ============================================================
+# ENV CONFIG
+# ============================================================
+# Finished /query jobs are kept this long for status polls
+QUERY_JOB_TTL_SECONDS = int(os.getenv("QUERY_JOB_TTL_SECONDS", str(7 * 24 * 3600)))
+
+# Mongo error codes for an existing index with the same name/keys but other options
+INDEX_CONFLICT_CODES = {85, 86}
+
+
+# ============================================================
+# DECLARED INDEXES
+# ============================================================
+# (collection, keys, options). Every index is named so it can be verified.
+INDEXES = [
+    # GET /chat/threads: a user's threads, most recently active first
+    (chat_threads, [("user_id", ASCENDING), ("updated_at", DESCENDING), ("_id", DESCENDING)],
+     {"name": "threads_by_recency"}),
+    # One thread document per (thread, owner); makes the turn upserts in save_turns safe
+    (chat_threads, [("thread_id", ASCENDING), ("user_id", ASCENDING)],
+     {"name": "thread_owner", "unique": True}),
+    # Archival scan: live threads idle the longest
+    (chat_threads, [("archived", ASCENDING), ("updated_at", ASCENDING)],
+     {"name": "threads_by_idle"}),
+
+    # GET /chat/messages/{thread_id}: a thread's messages in order
+    (chat_messages, [("thread_id", ASCENDING), ("user_id", ASCENDING), ("_id", ASCENDING)],
+     {"name": "messages_by_thread"}),
+    # Search indexer: only messages still waiting to be indexed are in it
+    (chat_messages, [("search_pending", ASCENDING), ("_id", ASCENDING)],
+     {"name": "messages_search_pending", "partialFilterExpression": {"search_pending": True}}),
+
+    # /chat/search and indexing: the posting blocks of one user's term
+    (chat_postings, [("user_id", ASCENDING), ("term", ASCENDING)],
+     {"name": "posting_blocks_by_term"}),
+
+    (thread_documents, [("thread_id", ASCENDING), ("user_id", ASCENDING), ("sha256", ASCENDING)],
+     {"name": "thread_document", "unique": True}),
+
+    (query_jobs, [("created_at", ASCENDING)],
+     {"name": "query_job_ttl", "expireAfterSeconds": QUERY_JOB_TTL_SECONDS}),
+
+    (idempotency_keys, [("created_at", ASCENDING)],
+     {"name": "idempotency_ttl", "expireAfterSeconds": IDEMPOTENCY_TTL_SECONDS}),
+
+    (users, [("email", ASCENDING)],
+     {"name": "user_email", "unique": True}),
+]
+
+
+async def _create(collection, keys, options):
+    try:
+        await collection.create_index(keys, **options)
+    except OperationFailure as e:
+        if e.code in INDEX_CONFLICT_CODES and "expireAfterSeconds" in options:
+            # Only the TTL changed: update it in place instead of rebuilding
+            await collection.database.command(
+                "collMod", collection.name,
+                index={"name": options["name"], "expireAfterSeconds": options["expireAfterSeconds"]}
+            )
+            logger.info(f"Updated TTL of {collection.name}.{options['name']}")
+        else:
+            raise
+
+
+async def _verify(collection, keys, options) -> bool:
+    existing = await collection.index_information()
+    index = existing.get(options["name"])
+    if index is None:
+        return False
+    if [tuple(k) for k in index["key"]] != [tuple(k) for k in keys]:
+        return False
+    return all(index.get(opt) == value for opt, value in options.items() if opt != "name")
+
+
+async def ensure_indexes() -> list:
+    """
+    Creates the declared indexes (a no-op for ones that already exist) and
+    checks that each one is in place with the declared keys and options.
+    Failures, e.g. a unique index over existing duplicates, are logged and
+    returned rather than stopping the app from starting.
+    """
+    problems = []
+    for collection, keys, options in INDEXES:
+        label = f"{collection.name}.{options['name']}"
+        try:
+            await _create(collection, keys, options)
+            if not await _verify(collection, keys, options):
+                problems.append(f"{label}: present but does not match the declaration")
+        except Exception as e:
+            problems.append(f"{label}: {e}")
+
+    for problem in problems:
+        logger.error(f"Index check failed: {problem}")
+    if not problems:
+        logger.info(f"Verified {len(INDEXES)} indexes")
+    return problems
@@ -0,0 +1,102 @@
+import os
+import zlib
+import asyncio
+import logging
+from typing import List
+
+from bson import Binary
+
+from blob_store import get_blob_store
+
+logger = logging.getLogger("message_store")
+logger.setLevel(logging.INFO)
+
+
+# ============================================================
+# ENV CONFIG
+# ============================================================
+# Messages up to this size (utf-8 bytes) are stored inline as plain text
+MESSAGE_INLINE_MAX_BYTES = int(os.getenv("MESSAGE_INLINE_MAX_BYTES", str(8 * 1024)))
+
+# Compressed messages above this size go to blob storage instead of Mongo
+MESSAGE_OFFLOAD_MIN_BYTES = int(os.getenv("MESSAGE_OFFLOAD_MIN_BYTES", str(64 * 1024)))
+
+# Characters kept inline in `message` for packed messages; at least the
+# largest /chat/messages preview_chars, so previews never need rehydration
+MESSAGE_PREVIEW_CHARS = int(os.getenv("MESSAGE_PREVIEW_CHARS", "2000"))
+
+CHAT_BLOB_CONTAINER = os.getenv("CHAT_BLOB_CONTAINER", "chat-messages")
+
+# Stored alongside the preview (and the search indexer's flag); never
+# returned to clients
+STORAGE_FIELDS = ("message_z", "message_blob", "message_encoding", "search_pending")
+
+message_store = get_blob_store(CHAT_BLOB_CONTAINER)
+
+
+def message_blob_name(doc: dict) -> str:
+    return f"messages/{doc['thread_id']}/{doc['_id']}.z"
+
+
+# ============================================================
+# PACK (on write)
+# ============================================================
+def _pack(doc: dict) -> dict:
+    text = doc.get("message") or ""
+    raw = text.encode("utf-8")
+    if len(raw) <= MESSAGE_INLINE_MAX_BYTES:
+        return doc
+
+    compressed = zlib.compress(raw, 6)
+    packed = dict(doc)
+    packed["message"] = text[:MESSAGE_PREVIEW_CHARS]
+    packed["message_encoding"] = "zlib"
+
+    if len(compressed) >= MESSAGE_OFFLOAD_MIN_BYTES:
+        name = message_blob_name(doc)
+        message_store.put(name, compressed, content_type="application/zlib")
+        packed["message_blob"] = name
+    else:
+        packed["message_z"] = Binary(compressed)
+    return packed
+
+
+async def pack_messages(docs: List[dict]) -> List[dict]:
+    """
+    Returns the documents to insert: large messages keep a preview inline
+    and their full text zlib-compressed (message_z) or, when still large,
+    offloaded to blob storage (message_blob). Small ones are unchanged.
+    """
+    if not any(len((d.get("message") or "").encode("utf-8")) > MESSAGE_INLINE_MAX_BYTES for d in docs):
+        return docs
+    return await asyncio.to_thread(lambda: [_pack(d) for d in docs])
+
+
+# ============================================================
+# REHYDRATE (on read)
+# ============================================================
+def _unpack(doc: dict):
+    if doc.get("message_encoding") == "zlib":
+        try:
+            if doc.get("message_blob"):
+                compressed = message_store.get(doc["message_blob"])
+            else:
+                compressed = bytes(doc["message_z"])
+            doc["message"] = zlib.decompress(compressed).decode("utf-8")
+        except Exception as e:
+            # Serve the inline preview rather than failing the whole page
+            logger.error(f"Could not rehydrate message {doc.get('_id')}: {e}")
+
+    for field in STORAGE_FIELDS:
+        doc.pop(field, None)
+
+
+async def rehydrate_messages(docs: List[dict]) -> List[dict]:
+    """Restores the full text of packed messages in place; the API shape is unchanged."""
+    if any(doc.get("message_encoding") for doc in docs):
+        await asyncio.to_thread(lambda: [_unpack(d) for d in docs])
+    else:
+        for doc in docs:
+            for field in STORAGE_FIELDS:
+                doc.pop(field, None)
+    return docs
@@ -0,0 +1,132 @@
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from bson import ObjectId
+from fastapi import HTTPException
+
+# ============================================================
+# CONFIG
+# ============================================================
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# Response header carrying the cursor for the next page (absent on the last page)
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+EPOCH = datetime(1970, 1, 1)
+MILLISECOND = timedelta(milliseconds=1)
+
+
+# ============================================================
+# CURSORS
+# ============================================================
+# Sorting by _id: the cursor is the ObjectId. Sorting by a datetime field:
+# "<epoch millis>_<ObjectId>", with _id breaking ties between equal times.
+def encode_cursor(doc: dict, sort_field: str = "_id") -> str:
+    if sort_field == "_id":
+        return str(doc["_id"])
+    millis = (doc[sort_field] - EPOCH) // MILLISECOND
+    return f"{millis}_{doc['_id']}"
+
+
+def parse_cursor(value: Optional[str], name: str, sort_field: str = "_id"):
+    """Returns None, an ObjectId (_id sort) or (datetime, ObjectId)."""
+    if value is None:
+        return None
+
+    if sort_field == "_id":
+        if not ObjectId.is_valid(value):
+            raise HTTPException(status_code=400, detail=f"Invalid {name} cursor")
+        return ObjectId(value)
+
+    millis, _, oid = value.partition("_")
+    if not millis.lstrip("-").isdigit() or not ObjectId.is_valid(oid):
+        raise HTTPException(status_code=400, detail=f"Invalid {name} cursor")
+    return EPOCH + int(millis) * MILLISECOND, ObjectId(oid)
+
+
+def parse_fields(fields: Optional[str], allowed: Iterable[str]) -> Optional[Dict[str, int]]:
+    """'title,updated_at' -> {"title": 1, "updated_at": 1}; None means all fields."""
+    if not fields:
+        return None
+
+    requested = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = sorted(set(requested) - set(allowed))
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown fields: {', '.join(unknown)}. Allowed: {', '.join(sorted(allowed))}"
+        )
+    return {f: 1 for f in requested}
+
+
+def _range(sort_field: str, op: str, cursor) -> dict:
+    if sort_field == "_id":
+        return {"_id": {op: cursor}}
+    value, oid = cursor
+    return {"$or": [
+        {sort_field: {op: value}},
+        {sort_field: value, "_id": {op: oid}},
+    ]}
+
+
+# ============================================================
+# KEYSET PAGE
+# ============================================================
+async def keyset_page(
+    collection,
+    query: dict,
+    before=None,
+    after=None,
+    limit: int = DEFAULT_PAGE_SIZE,
+    projection: Optional[dict] = None,
+    sort_field: str = "_id"
+) -> Tuple[List[dict], Optional[str]]:
+    """
+    One page of documents ordered newest first by sort_field (then _id).
+
+    Default / `before`: the `limit` newest documents older than the cursor.
+    `after`: the `limit` documents immediately newer than the cursor.
+    The returned cursor continues in the same direction (pass it back as
+    the same parameter) and is None when there is nothing more.
+
+    The range plus the limit is served from a compound index ending in
+    (sort_field, _id), so the cost of a page does not depend on history size.
+    """
+    if before is not None and after is not None:
+        raise HTTPException(status_code=400, detail="Use either before or after, not both")
+
+    match = dict(query)
+    if before is not None:
+        match.update(_range(sort_field, "$lt", before))
+    elif after is not None:
+        match.update(_range(sort_field, "$gt", after))
+
+    # Walking forward from `after` needs the oldest newer documents first
+    direction = 1 if after is not None else -1
+    sort = {sort_field: direction}
+    if sort_field != "_id":
+        sort["_id"] = direction
+
+    # One extra document tells whether another page exists
+    pipeline = [
+        {"$match": match},
+        {"$sort": sort},
+        {"$limit": limit + 1},
+    ]
+    if projection:
+        # The cursor is built from the sort field, so it is always returned
+        pipeline.append({"$project": {**projection, sort_field: 1}})
+
+    docs = [doc async for doc in collection.aggregate(pipeline)]
+
+    has_more = len(docs) > limit
+    docs = docs[:limit]
+    next_cursor = encode_cursor(docs[-1], sort_field) if has_more else None
+
+    if direction == 1:
+        docs.reverse()
+
+    for doc in docs:
+        doc["_id"] = str(doc["_id"])
+    return docs, next_cursor
@@ -0,0 +1,183 @@
+import os
+import re
+import math
+import threading
+from collections import OrderedDict, Counter, defaultdict
+from typing import Dict, List, Optional, Tuple
+
+# ============================================================
+# ENV CONFIG
+# ============================================================
+# Prompt budget for document context, in (approximate) tokens.
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "750"))
+
+PASSAGE_WORDS = int(os.getenv("PASSAGE_WORDS", "120"))
+PASSAGE_OVERLAP_WORDS = int(os.getenv("PASSAGE_OVERLAP_WORDS", "20"))
+
+# Number of per-document indexes kept in memory
+PASSAGE_INDEX_CACHE_SIZE = int(os.getenv("PASSAGE_INDEX_CACHE_SIZE", "64"))
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+STOPWORDS = frozenset("""
+a an and are as at be by can do does for from has have how i if in is it its
+me my of on or shall should that the their there this to under was what when
+where which who why will with would you your
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in TOKEN_RE.findall(text.lower()) if t not in STOPWORDS]
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+# ============================================================
+# PER-DOCUMENT INDEX
+# ============================================================
+class PassageIndex:
+    """
+    Splits a document into overlapping word windows and precomputes a
+    BM25 inverted index over them, so ranking a question only touches
+    the postings of the question's terms.
+    """
+
+    def __init__(self, text: str):
+        words = text.split()
+        stride = max(1, PASSAGE_WORDS - PASSAGE_OVERLAP_WORDS)
+
+        self.passages: List[str] = []
+        for start in range(0, max(len(words), 1), stride):
+            window = words[start:start + PASSAGE_WORDS]
+            if window:
+                self.passages.append(" ".join(window))
+            if start + PASSAGE_WORDS >= len(words):
+                break
+
+        self.postings = defaultdict(list)
+        lengths = []
+        for pid, passage in enumerate(self.passages):
+            terms = Counter(tokenize(passage))
+            lengths.append(sum(terms.values()))
+            for term, tf in terms.items():
+                self.postings[term].append((pid, tf))
+
+        self.lengths = lengths
+        self.avg_length = (sum(lengths) / len(lengths)) if lengths else 0.0
+
+        n = len(self.passages)
+        self.idf = {
+            term: math.log(1 + (n - len(plist) + 0.5) / (len(plist) + 0.5))
+            for term, plist in self.postings.items()
+        }
+
+    def score(self, query_terms) -> dict:
+        scores = defaultdict(float)
+        for term in query_terms:
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for pid, tf in self.postings[term]:
+                norm = 1 - BM25_B + BM25_B * self.lengths[pid] / (self.avg_length or 1)
+                scores[pid] += idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * norm)
+        return scores
+
+
+_index_cache: "OrderedDict[str, PassageIndex]" = OrderedDict()
+_index_lock = threading.Lock()
+
+
+def cached_index(content_hash: str) -> Optional[PassageIndex]:
+    """Returns the cached index for a document hash, or None; never builds one."""
+    with _index_lock:
+        index = _index_cache.get(content_hash)
+        if index is not None:
+            _index_cache.move_to_end(content_hash)
+        return index
+
+
+def get_index(content_hash: str, text: str) -> PassageIndex:
+    """Returns the cached index for a document hash, building it on a miss."""
+    with _index_lock:
+        index = _index_cache.get(content_hash)
+        if index is not None:
+            _index_cache.move_to_end(content_hash)
+            return index
+
+    index = PassageIndex(text)
+
+    with _index_lock:
+        _index_cache[content_hash] = index
+        while len(_index_cache) > PASSAGE_INDEX_CACHE_SIZE:
+            _index_cache.popitem(last=False)
+
+    return index
+
+
+# ============================================================
+# SELECTION
+# ============================================================
+def select_passages(
+    documents: List[Tuple[str, str, Optional[str]]],
+    question: str,
+    token_budget: int = CONTEXT_TOKEN_BUDGET,
+    indexes: Optional[Dict[str, PassageIndex]] = None
+) -> List[Tuple[str, List[str]]]:
+    """
+    Picks the passages most relevant to the question across documents
+    given as (file_name, content_hash, text), packing them into the token
+    budget. Returns (file_name, passages) with passages in document order.
+    When nothing matches the question, leading passages are used instead.
+    `indexes` are already built indexes by hash (see cached_index); their
+    documents may be given with text None.
+    """
+    query_terms = set(tokenize(question))
+
+    indexes = [
+        (indexes or {}).get(content_hash) or get_index(content_hash, text)
+        for _, content_hash, text in documents
+    ]
+
+    candidates = []
+    for doc_no, index in enumerate(indexes):
+        for pid, score in index.score(query_terms).items():
+            candidates.append((score, doc_no, pid))
+
+    if candidates:
+        candidates.sort(key=lambda c: (-c[0], c[1], c[2]))
+    else:
+        # Nothing matched: fall back to the start of each document, round-robin
+        longest = max((len(index.passages) for index in indexes), default=0)
+        candidates = [
+            (0.0, doc_no, pid)
+            for pid in range(longest)
+            for doc_no, index in enumerate(indexes)
+            if pid < len(index.passages)
+        ]
+
+    chosen = defaultdict(dict)
+    used = 0
+    for _, doc_no, pid in candidates:
+        passage = indexes[doc_no].passages[pid]
+        cost = estimate_tokens(passage)
+        if used + cost > token_budget:
+            if used:
+                continue
+            # Budget smaller than one passage: keep the head of the best one
+            passage = passage[:token_budget * 4]
+            cost = token_budget
+        chosen[doc_no][pid] = passage
+        used += cost
+        if used >= token_budget:
+            break
+
+    return [
+        (documents[doc_no][0], [chosen[doc_no][pid] for pid in sorted(chosen[doc_no])])
+        for doc_no in range(len(documents))
+        if chosen[doc_no]
+    ]
@@ -0,0 +1,135 @@
+import io
+import os
+import re
+import asyncio
+import hashlib
+import logging
+from datetime import datetime, timedelta, timezone
+
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.utils import simpleSplit
+from reportlab.pdfgen import canvas
+
+from blob_store import get_blob_store
+
+logger = logging.getLogger("pdf_service")
+logger.setLevel(logging.INFO)
+
+
+# ============================================================
+# ENV CONFIG
+# ============================================================
+GENERATED_PDF_CONTAINER = os.getenv("GENERATED_PDF_CONTAINER", "generated-pdfs")
+GENERATED_PDF_TTL_SECONDS = int(os.getenv("GENERATED_PDF_TTL_SECONDS", str(7 * 24 * 3600)))
+GENERATED_PDF_EVICT_INTERVAL_SECONDS = int(os.getenv("GENERATED_PDF_EVICT_INTERVAL_SECONDS", "3600"))
+
+PDF_PREFIX = "pdf/"
+PDF_ID_RE = re.compile(r"^[0-9a-f]{64}$")
+
+FONT_NAME = "Helvetica"
+FONT_SIZE = 11
+LEADING = 15
+MARGIN = 40
+
+pdf_store = get_blob_store(GENERATED_PDF_CONTAINER)
+
+
+# ============================================================
+# RENDERING
+# ============================================================
+class TextPdfWriter:
+    """
+    Lays plain text out onto letter pages as it is written. Long lines are
+    word-wrapped to the page width and each page is emitted as a single text
+    object instead of one drawString call per line. reportlab keeps every
+    finished page in the document until close() (streams are compressed
+    only as it writes them out), so memory grows with the page count;
+    callers bound it through `pages`.
+    """
+
+    def __init__(self, out):
+        width, height = letter
+        self._canvas = canvas.Canvas(out, pagesize=letter, pageCompression=1)
+        self._top = height - MARGIN
+        self._max_width = width - 2 * MARGIN
+        self._lines_per_page = int((height - 2 * MARGIN) // LEADING)
+        self._lines = []
+        self._pages = 0
+
+    def write(self, text: str):
+        for raw_line in text.split("\n"):
+            for line in simpleSplit(raw_line, FONT_NAME, FONT_SIZE, self._max_width) or [""]:
+                self._lines.append(line)
+                if len(self._lines) == self._lines_per_page:
+                    self._emit_page()
+
+    def _emit_page(self):
+        text_object = self._canvas.beginText(MARGIN, self._top)
+        text_object.setFont(FONT_NAME, FONT_SIZE)
+        text_object.setLeading(LEADING)
+        for line in self._lines:
+            text_object.textLine(line)
+        self._canvas.drawText(text_object)
+        self._canvas.showPage()
+        self._lines = []
+        self._pages += 1
+
+    @property
+    def pages(self) -> int:
+        return self._pages
+
+    def close(self):
+        if self._lines or not self._pages:
+            self._emit_page()
+        self._canvas.save()
+
+
+def render_pdf(text: str) -> bytes:
+    """Renders plain text to PDF bytes in memory."""
+    buffer = io.BytesIO()
+    writer = TextPdfWriter(buffer)
+    writer.write(text)
+    writer.close()
+    return buffer.getvalue()
+
+
+def pdf_blob_name(pdf_id: str) -> str:
+    return f"{PDF_PREFIX}{pdf_id}.pdf"
+
+
+def _store(data: bytes) -> str:
+    pdf_id = hashlib.sha256(data).hexdigest()
+    # Content-addressed: the same document maps to one blob however often it is
+    # generated; rewriting it refreshes last-modified, which eviction keys on
+    pdf_store.put(pdf_blob_name(pdf_id), data, content_type="application/pdf")
+    return pdf_id
+
+
+async def create_pdf(text: str) -> str:
+    """Renders and stores a PDF, returning its id for GET /download/{id}."""
+    data = await asyncio.to_thread(render_pdf, text)
+    return await asyncio.to_thread(_store, data)
+
+
+# ============================================================
+# EVICTION
+# ============================================================
+def evict_expired() -> int:
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=GENERATED_PDF_TTL_SECONDS)
+    evicted = 0
+    for name, modified in pdf_store.list(PDF_PREFIX):
+        if modified < cutoff:
+            pdf_store.delete(name)
+            evicted += 1
+    return evicted
+
+
+async def eviction_loop():
+    while True:
+        try:
+            evicted = await asyncio.to_thread(evict_expired)
+            if evicted:
+                logger.info(f"Evicted {evicted} generated PDFs older than {GENERATED_PDF_TTL_SECONDS}s")
+        except Exception as e:
+            logger.error(f"Generated PDF eviction failed: {e}", exc_info=True)
+        await asyncio.sleep(GENERATED_PDF_EVICT_INTERVAL_SECONDS)
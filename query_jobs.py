@@ -0,0 +1,161 @@
+import os
+import uuid
+import asyncio
+import logging
+from datetime import datetime
+from typing import Awaitable, Callable, Optional
+
+from fastapi import HTTPException
+
+from db import query_jobs
+
+logger = logging.getLogger("query_jobs")
+logger.setLevel(logging.INFO)
+
+
+# ============================================================
+# ENV CONFIG
+# ============================================================
+# Workers per process, i.e. max async /query jobs running at once per worker.
+QUERY_JOB_WORKERS = int(os.getenv("QUERY_JOB_WORKERS", "4"))
+
+# Jobs waiting for a worker before new submissions are rejected with 503.
+QUERY_JOB_MAX_PENDING = int(os.getenv("QUERY_JOB_MAX_PENDING", "100"))
+
+
+# ============================================================
+# JOB QUEUE
+# ============================================================
+class QueryJobQueue:
+    """
+    In-process worker pool for /query jobs. Job state lives in the
+    `query_jobs` Mongo collection so any worker can answer status polls;
+    execution happens in the worker process that accepted the job.
+    """
+
+    def __init__(self, handler, workers: int, max_pending: int):
+        self._handler = handler
+        self._workers = workers
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_pending)
+        self._tasks = []
+        self._running = set()
+
+    def start(self):
+        if self._tasks:
+            return
+        for i in range(self._workers):
+            self._tasks.append(asyncio.create_task(self._worker(i)))
+        logger.info(f"Started {self._workers} query job workers")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+        # Jobs in this process will never finish; tell their pollers now
+        # rather than leaving them queued/running until the TTL removes them
+        abandoned = set(self._running)
+        while not self._queue.empty():
+            job_id, _, _, on_finish = self._queue.get_nowait()
+            abandoned.add(job_id)
+            await self._finish(job_id, on_finish)
+        self._running.clear()
+
+        if abandoned:
+            try:
+                await query_jobs.update_many(
+                    {"_id": {"$in": list(abandoned)}, "status": {"$in": ["queued", "running"]}},
+                    {"$set": {
+                        "status": "failed",
+                        "error": {"status_code": 503, "detail": "Server restarted before the query finished, retry it"},
+                        "finished_at": datetime.utcnow()
+                    }}
+                )
+            except Exception as e:
+                logger.error(f"Could not mark {len(abandoned)} abandoned query jobs as failed: {e}")
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    async def submit(
+        self,
+        user_id: str,
+        on_finish: Optional[Callable[[], Awaitable]] = None,
+        **payload
+    ) -> str:
+        """
+        Queues a job and returns its id. on_finish is awaited once the job
+        has finished (or been abandoned), e.g. to release a rate-limit slot;
+        it is not called when submit raises.
+        """
+        if self._queue.full():
+            raise HTTPException(status_code=503, detail="Too many queued queries, retry later")
+
+        job_id = uuid.uuid4().hex
+        await query_jobs.insert_one({
+            "_id": job_id,
+            "user_id": user_id,
+            "status": "queued",
+            "created_at": datetime.utcnow()
+        })
+
+        try:
+            # Another submit may have taken the last slot while we were inserting
+            self._queue.put_nowait((job_id, user_id, payload, on_finish))
+        except asyncio.QueueFull:
+            await query_jobs.delete_one({"_id": job_id})
+            raise HTTPException(status_code=503, detail="Too many queued queries, retry later")
+        return job_id
+
+    async def get(self, job_id: str, user_id: str) -> dict:
+        job = await query_jobs.find_one({"_id": job_id, "user_id": user_id})
+        if not job:
+            raise HTTPException(status_code=404, detail="Job not found")
+
+        job["job_id"] = job.pop("_id")
+        return job
+
+    async def _worker(self, index: int):
+        while True:
+            job_id, user_id, payload, on_finish = await self._queue.get()
+            self._running.add(job_id)
+            try:
+                await self._run(job_id, user_id, payload)
+            except Exception as e:
+                # Recording the job's state failed (Mongo); keep the worker alive
+                logger.error(f"Query job {job_id} could not be recorded: {e}", exc_info=True)
+            finally:
+                self._queue.task_done()
+                await self._finish(job_id, on_finish)
+            # Not in finally: a job cancelled by stop() must stay listed for it
+            self._running.discard(job_id)
+
+    async def _finish(self, job_id: str, on_finish: Optional[Callable[[], Awaitable]]):
+        if on_finish is None:
+            return
+        try:
+            await on_finish()
+        except Exception as e:
+            logger.error(f"on_finish of query job {job_id} failed: {e}", exc_info=True)
+
+    async def _run(self, job_id: str, user_id: str, payload: dict):
+        await query_jobs.update_one(
+            {"_id": job_id},
+            {"$set": {"status": "running", "started_at": datetime.utcnow()}}
+        )
+
+        update = {}
+        try:
+            update["result"] = await self._handler(user_id=user_id, **payload)
+            update["status"] = "succeeded"
+        except HTTPException as e:
+            update["status"] = "failed"
+            update["error"] = {"status_code": e.status_code, "detail": e.detail}
+        except Exception as e:
+            logger.error(f"Query job {job_id} crashed: {e}", exc_info=True)
+            update["status"] = "failed"
+            update["error"] = {"status_code": 500, "detail": "Internal error while running query"}
+
+        update["finished_at"] = datetime.utcnow()
+        await query_jobs.update_one({"_id": job_id}, {"$set": update})
@@ -0,0 +1,279 @@
+import os
+import time
+import math
+import logging
+from typing import Callable, Dict, NamedTuple, Optional
+
+from fastapi import HTTPException, Request
+
+logger = logging.getLogger("rate_limit")
+logger.setLevel(logging.INFO)
+
+
+# ============================================================
+# LIMITS
+# ============================================================
+class Limit(NamedTuple):
+    per_minute: float     # token bucket refill rate
+    burst: int            # bucket capacity
+    concurrent: int       # requests in flight at once (0 = unlimited)
+
+
+def _limit_from_env(name: str, default: Limit) -> Limit:
+    """Reads "per_minute,burst,concurrent" from the environment, e.g. 10,5,2."""
+    raw = os.getenv(name)
+    if not raw:
+        return default
+    try:
+        per_minute, burst, concurrent = (part.strip() for part in raw.split(","))
+        return Limit(float(per_minute), int(burst), int(concurrent))
+    except ValueError:
+        logger.warning(f"Ignoring malformed {name}={raw!r}, expected per_minute,burst,concurrent")
+        return default
+
+
+# Per route, per role. Unauthenticated callers use the "anonymous" entry and
+# are keyed by client IP (see RATE_LIMIT_TRUSTED_PROXY_HOPS) instead of the JWT sub.
+POLICIES: Dict[str, Dict[str, Limit]] = {
+    "query": {
+        "user": _limit_from_env("RATE_LIMIT_QUERY_USER", Limit(20, 5, 2)),
+        "admin": _limit_from_env("RATE_LIMIT_QUERY_ADMIN", Limit(60, 15, 6)),
+    },
+    "template_view": {
+        "user": _limit_from_env("RATE_LIMIT_TEMPLATE_VIEW_USER", Limit(30, 10, 2)),
+        "admin": _limit_from_env("RATE_LIMIT_TEMPLATE_VIEW_ADMIN", Limit(60, 20, 4)),
+    },
+    "otp": {
+        "anonymous": _limit_from_env("RATE_LIMIT_OTP", Limit(5, 3, 0)),
+    },
+}
+
+# Routes whose work lands on the shared agent / job queues; these are shed
+# with 503 once the global queue depth passes LOAD_SHED_QUEUE_DEPTH.
+SHEDDABLE_ROUTES = {"query", "template_view"}
+
+LOAD_SHED_QUEUE_DEPTH = int(os.getenv("LOAD_SHED_QUEUE_DEPTH", "50"))
+LOAD_SHED_RETRY_AFTER_SECONDS = int(os.getenv("LOAD_SHED_RETRY_AFTER_SECONDS", "5"))
+
+# Reverse proxies in front of the app that append to X-Forwarded-For. The
+# client IP is the entry this many hops from the right; 1 for App Service
+# (its front ends append the caller's address). 0 uses the socket peer,
+# for deployments reached directly; any other value lets callers spoof it.
+RATE_LIMIT_TRUSTED_PROXY_HOPS = int(os.getenv("RATE_LIMIT_TRUSTED_PROXY_HOPS", "1"))
+
+# Idle buckets are dropped after this long (they would be full again anyway)
+BUCKET_IDLE_SECONDS = 3600
+
+
+# ============================================================
+# BACKENDS
+# ============================================================
+class RateLimitBackend:
+    """
+    Storage for buckets and concurrency counters. The in-memory backend is
+    per process; a shared store (e.g. Redis) can implement the same three
+    methods to enforce limits across workers.
+    """
+
+    async def take_token(self, key: str, per_minute: float, burst: int) -> float:
+        """Consumes one token; returns 0 if allowed, else seconds until one is available."""
+        raise NotImplementedError
+
+    async def acquire_slot(self, key: str, limit: int) -> bool:
+        raise NotImplementedError
+
+    async def release_slot(self, key: str):
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        return {}
+
+
+class InMemoryBackend(RateLimitBackend):
+    def __init__(self):
+        self._buckets: Dict[str, list] = {}    # key -> [tokens, updated_at]
+        self._slots: Dict[str, int] = {}
+        self._last_sweep = time.monotonic()
+
+    def _sweep(self, now: float):
+        if now - self._last_sweep < BUCKET_IDLE_SECONDS:
+            return
+        self._last_sweep = now
+        idle = [k for k, (_, updated) in self._buckets.items() if now - updated > BUCKET_IDLE_SECONDS]
+        for k in idle:
+            del self._buckets[k]
+
+    async def take_token(self, key: str, per_minute: float, burst: int) -> float:
+        now = time.monotonic()
+        self._sweep(now)
+        rate = per_minute / 60.0
+
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [float(burst), now]
+        else:
+            bucket[0] = min(float(burst), bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            return 0.0
+        return (1 - bucket[0]) / rate if rate > 0 else float(BUCKET_IDLE_SECONDS)
+
+    async def acquire_slot(self, key: str, limit: int) -> bool:
+        in_use = self._slots.get(key, 0)
+        if in_use >= limit:
+            return False
+        self._slots[key] = in_use + 1
+        return True
+
+    async def release_slot(self, key: str):
+        in_use = self._slots.get(key, 0) - 1
+        if in_use > 0:
+            self._slots[key] = in_use
+        else:
+            self._slots.pop(key, None)
+
+    def stats(self) -> dict:
+        return {
+            "buckets": len(self._buckets),
+            "requests_in_flight": sum(self._slots.values()),
+        }
+
+
+# ============================================================
+# LIMITER
+# ============================================================
+def _too_many(detail: str, retry_after: float, status_code: int = 429) -> HTTPException:
+    return HTTPException(
+        status_code=status_code,
+        detail=detail,
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+    )
+
+
+def _strip_port(address: str) -> str:
+    if address.startswith("["):
+        return address[1:].split("]", 1)[0]
+    if address.count(":") == 1:
+        return address.split(":", 1)[0]
+    return address
+
+
+def client_ip(request: Request) -> str:
+    """The caller's address, taken from the trusted X-Forwarded-For hop when behind proxies."""
+    if RATE_LIMIT_TRUSTED_PROXY_HOPS > 0:
+        forwarded = [
+            hop.strip()
+            for header in request.headers.getlist("x-forwarded-for")
+            for hop in header.split(",")
+            if hop.strip()
+        ]
+        if len(forwarded) >= RATE_LIMIT_TRUSTED_PROXY_HOPS:
+            return _strip_port(forwarded[-RATE_LIMIT_TRUSTED_PROXY_HOPS])
+    return request.client.host if request.client else "unknown"
+
+
+class RateLimiter:
+    def __init__(self, backend: RateLimitBackend, policies: Dict[str, Dict[str, Limit]]):
+        self._backend = backend
+        self._policies = policies
+        self._load_probe: Optional[Callable[[], int]] = None
+        self.rejected = 0
+        self.shed = 0
+
+    def set_load_probe(self, probe: Callable[[], int]):
+        """probe() returns the current global queue depth used for load shedding."""
+        self._load_probe = probe
+
+    def _identity(self, request: Request):
+        user_id = getattr(request.state, "user_id", None)
+        if user_id:
+            roles = getattr(request.state, "roles", None) or []
+            role = "admin" if "admin" in roles else "user"
+            return f"user:{user_id}", role
+
+        return f"ip:{client_ip(request)}", "anonymous"
+
+    def _policy(self, route: str, role: str) -> Limit:
+        policy = self._policies[route]
+        return policy.get(role) or policy.get("user") or policy["anonymous"]
+
+    async def admit(self, route: str, request: Request) -> Optional[str]:
+        """
+        Admits one request or raises 429 (rate / concurrency) or 503 (load
+        shedding), both with Retry-After. Returns the concurrency slot key
+        the caller must release, or None when no slot was taken.
+        """
+        identity, role = self._identity(request)
+
+        if route in SHEDDABLE_ROUTES and role != "admin" and self._load_probe is not None:
+            depth = self._load_probe()
+            if depth > LOAD_SHED_QUEUE_DEPTH:
+                self.shed += 1
+                logger.warning(f"Shedding {route} for {identity}: queue depth {depth}")
+                raise _too_many(
+                    "Server is busy, retry later", LOAD_SHED_RETRY_AFTER_SECONDS, status_code=503
+                )
+
+        limit = self._policy(route, role)
+        key = f"{route}:{identity}"
+
+        wait = await self._backend.take_token(key, limit.per_minute, limit.burst)
+        if wait > 0:
+            self.rejected += 1
+            logger.info(f"Rate limited {route} for {identity}, retry in {wait:.1f}s")
+            raise _too_many("Too many requests, slow down", wait)
+
+        if not limit.concurrent:
+            return None
+
+        if not await self._backend.acquire_slot(key, limit.concurrent):
+            self.rejected += 1
+            logger.info(f"Concurrency limit ({limit.concurrent}) hit on {route} for {identity}")
+            raise _too_many("Too many requests in progress", 1)
+        return key
+
+    async def release(self, slot_key: Optional[str]):
+        if slot_key is not None:
+            await self._backend.release_slot(slot_key)
+
+    def stats(self) -> dict:
+        return {
+            **self._backend.stats(),
+            "rejected": self.rejected,
+            "shed": self.shed,
+        }
+
+
+rate_limiter = RateLimiter(InMemoryBackend(), POLICIES)
+
+
+def rate_limit(route: str):
+    """
+    Route dependency: Depends(rate_limit("query")). The concurrency slot is
+    held until the response (including a streamed body) has been sent, or
+    by whoever took it over with hand_off_slot.
+    """
+    if route not in POLICIES:
+        raise ValueError(f"No rate limit policy for route '{route}'")
+
+    async def dependency(request: Request):
+        request.state.rate_limit_slot = await rate_limiter.admit(route, request)
+        try:
+            yield
+        finally:
+            await rate_limiter.release(request.state.rate_limit_slot)
+
+    return dependency
+
+
+def hand_off_slot(request: Request) -> Optional[str]:
+    """
+    Takes the request's concurrency slot away from rate_limit, for work that
+    outlives the response (a queued job). The new owner must pass the
+    returned key to rate_limiter.release once the work is done.
+    """
+    slot_key = getattr(request.state, "rate_limit_slot", None)
+    request.state.rate_limit_slot = None
+    return slot_key
@@ -0,0 +1,326 @@
+"""
+Incrementally maintained full-text index over chat_messages, per user.
+
+    chat_postings       blocks of up to SEARCH_BLOCK_POSTINGS postings
+                        (message_id, thread_id, tf, length) for one
+                        (user, term); new postings go to the open block
+    chat_search_stats   one document per user: indexed message count and
+                        total length (BM25's N and average length)
+
+A query reads the stats document plus every block of its terms, so all of
+a term's matches are scored, however old, and a message adds one small
+update per distinct term rather than one document per term.
+
+Messages are written with search_pending set; index_loop indexes them in
+the background, off the /query path, and clears the flag. Indexing the same
+message twice (two workers, or a retry after a crash) neither counts it
+twice nor scores it twice. To (re)build the index from chat_messages, e.g.
+after changing its format:
+
+    python search_index.py
+"""
+import os
+import re
+import math
+import asyncio
+import logging
+from collections import Counter, defaultdict
+from typing import List, Optional
+
+from dotenv import load_dotenv
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+load_dotenv()
+
+from db import chat_messages, chat_threads, chat_postings, chat_search_stats, DUPLICATE_KEY
+from passages import tokenize, BM25_K1, BM25_B
+from message_store import rehydrate_messages
+
+logger = logging.getLogger("search_index")
+logger.setLevel(logging.INFO)
+
+
+# ============================================================
+# ENV CONFIG
+# ============================================================
+# Postings per block; a query reads about df / SEARCH_BLOCK_POSTINGS blocks per term
+SEARCH_BLOCK_POSTINGS = int(os.getenv("SEARCH_BLOCK_POSTINGS", "1000"))
+
+# How often each worker looks for messages waiting to be indexed
+SEARCH_INDEX_INTERVAL_SECONDS = float(os.getenv("SEARCH_INDEX_INTERVAL_SECONDS", "2"))
+SEARCH_INDEX_BATCH = int(os.getenv("SEARCH_INDEX_BATCH", "200"))
+
+# Recently counted message ids kept on the stats document, so a replayed
+# batch is not counted again (replays happen within seconds)
+SEARCH_COUNTED_KEPT = 1000
+
+SEARCH_MAX_QUERY_TERMS = 10
+SNIPPET_CHARS = 160
+
+
+# ============================================================
+# INDEXING
+# ============================================================
+def _analyze(messages: List[dict]):
+    """
+    Returns ({(user_id, term): [posting, ...]}, {user_id: [(message_id, length), ...]})
+    for the messages that have any terms.
+    """
+    postings = defaultdict(list)
+    lengths = defaultdict(list)
+    for msg in messages:
+        terms = tokenize(msg.get("message") or "")
+        if not terms:
+            continue
+
+        lengths[msg["user_id"]].append((msg["_id"], len(terms)))
+        for term, tf in Counter(terms).items():
+            postings[(msg["user_id"], term)].append({
+                "message_id": msg["_id"],
+                "thread_id": msg["thread_id"],
+                "tf": tf,
+                "length": len(terms)
+            })
+    return postings, lengths
+
+
+def _stats_update(user_id: str, lengths: list) -> UpdateOne:
+    """
+    Adds messages to the user's N and total length unless they are among
+    the recently counted ids; a pipeline, so the check and the add see the
+    same document (same pattern as history._thread_updates).
+    """
+    counted = {"$ifNull": ["$counted", []]}
+
+    def is_new(message_id):
+        return {"$not": [{"$in": [message_id, counted]}]}
+
+    return UpdateOne(
+        {"_id": user_id},
+        [{"$set": {
+            "messages": {"$add": [{"$ifNull": ["$messages", 0]}] + [
+                {"$cond": [is_new(message_id), 1, 0]} for message_id, _ in lengths
+            ]},
+            "total_length": {"$add": [{"$ifNull": ["$total_length", 0]}] + [
+                {"$cond": [is_new(message_id), length, 0]} for message_id, length in lengths
+            ]},
+            "counted": {"$slice": [
+                {"$concatArrays": [counted] + [
+                    {"$cond": [is_new(message_id), [message_id], []]} for message_id, _ in lengths
+                ]},
+                -SEARCH_COUNTED_KEPT
+            ]}
+        }}],
+        upsert=True
+    )
+
+
+async def _bulk_upsert(collection, updates):
+    try:
+        await collection.bulk_write(updates, ordered=False)
+    except BulkWriteError as e:
+        errors = e.details["writeErrors"]
+        if any(err["code"] != DUPLICATE_KEY for err in errors):
+            raise
+        # Lost concurrent upsert races: the documents exist now, so retrying matches them
+        await collection.bulk_write([updates[err["index"]] for err in errors], ordered=False)
+
+
+async def index_messages(messages: List[dict]):
+    """Adds messages (with their full text) to their owners' indexes."""
+    postings, lengths = _analyze(messages)
+    if not postings:
+        return
+
+    # $addToSet: a message re-indexed into the same block adds nothing; one
+    # that lands in a newer block is deduplicated when the term is read
+    await chat_postings.bulk_write([
+        UpdateOne(
+            {"user_id": user_id, "term": term, "count": {"$lt": SEARCH_BLOCK_POSTINGS}},
+            {"$addToSet": {"postings": {"$each": entries}}, "$inc": {"count": len(entries)}},
+            upsert=True
+        )
+        for (user_id, term), entries in postings.items()
+    ], ordered=False)
+
+    # After the postings, so a crash in between re-adds them but never counts twice
+    await _bulk_upsert(chat_search_stats, [
+        _stats_update(user_id, user_lengths) for user_id, user_lengths in lengths.items()
+    ])
+
+
+async def unindex_messages(user_id: str, messages: List[dict]):
+    """
+    Removes some of a user's messages (as stored in chat_messages) from the
+    index, e.g. when they are archived. Messages the indexer has not reached
+    yet were never counted and are left out.
+    """
+    indexed = [msg for msg in messages if not msg.get("search_pending")]
+    postings, lengths = _analyze(await rehydrate_messages(indexed))
+    if not postings:
+        return
+
+    ids = [message_id for message_id, _ in lengths[user_id]]
+    await chat_postings.update_many(
+        {"user_id": user_id, "term": {"$in": [term for _, term in postings]}},
+        {"$pull": {"postings": {"message_id": {"$in": ids}}}}
+    )
+    # Dropped from counted too, so a later rehydration counts them again
+    await chat_search_stats.update_one(
+        {"_id": user_id},
+        {
+            "$inc": {"messages": -len(ids), "total_length": -sum(length for _, length in lengths[user_id])},
+            "$pull": {"counted": {"$in": ids}}
+        }
+    )
+
+
+async def index_pending() -> int:
+    """Indexes one batch of messages written with search_pending; returns its size."""
+    pending = await chat_messages.find(
+        {"search_pending": True}
+    ).sort("_id", 1).limit(SEARCH_INDEX_BATCH).to_list(None)
+    if not pending:
+        return 0
+
+    ids = [msg["_id"] for msg in pending]
+    await index_messages(await rehydrate_messages(pending))
+    await chat_messages.update_many({"_id": {"$in": ids}}, {"$unset": {"search_pending": ""}})
+    return len(pending)
+
+
+async def index_loop():
+    """
+    Background indexer. Every worker runs one; two picking up the same
+    messages index them only once (see index_messages).
+    """
+    while True:
+        try:
+            while await index_pending() >= SEARCH_INDEX_BATCH:
+                pass
+        except Exception as e:
+            logger.error(f"Search indexing failed, will retry: {e}", exc_info=True)
+        await asyncio.sleep(SEARCH_INDEX_INTERVAL_SECONDS)
+
+
+# ============================================================
+# SEARCH
+# ============================================================
+def make_snippet(text: str, terms: List[str]) -> str:
+    """A window of the message around the first query term it contains."""
+    text = " ".join(text.split())
+    match = re.search(r"\b(" + "|".join(re.escape(t) for t in terms) + r")", text, re.IGNORECASE)
+    if not match or len(text) <= SNIPPET_CHARS:
+        start = 0
+    else:
+        start = max(0, match.start() - SNIPPET_CHARS // 3)
+
+    end = min(len(text), start + SNIPPET_CHARS)
+    snippet = text[start:end]
+    if start > 0:
+        snippet = "…" + snippet
+    if end < len(text):
+        snippet = snippet + "…"
+    return snippet
+
+
+async def search_messages(
+    user_id: str,
+    query: str,
+    offset: int = 0,
+    limit: int = 20,
+    thread_id: Optional[str] = None
+) -> dict:
+    """BM25-ranked messages of one user, with snippets. Paged by offset."""
+    terms = list(dict.fromkeys(tokenize(query)))[:SEARCH_MAX_QUERY_TERMS]
+    if not terms:
+        return {"query": query, "total": 0, "results": []}
+
+    stats = await chat_search_stats.find_one({"_id": user_id}, {"messages": 1, "total_length": 1})
+    n_messages = stats.get("messages", 0) if stats else 0
+    if n_messages <= 0:
+        return {"query": query, "total": 0, "results": []}
+    avg_length = max(stats.get("total_length", 0) / n_messages, 1.0)
+
+    # Every block of every query term, served by the (user_id, term) index
+    term_postings = defaultdict(dict)
+    async for block in chat_postings.find(
+        {"user_id": user_id, "term": {"$in": terms}}, {"_id": 0, "term": 1, "postings": 1}
+    ):
+        for p in block["postings"]:
+            term_postings[block["term"]][p["message_id"]] = p
+
+    scores = defaultdict(float)
+    for term, postings in term_postings.items():
+        df = len(postings)
+        idf = math.log(1 + (n_messages - df + 0.5) / (df + 0.5))
+        for message_id, p in postings.items():
+            if thread_id and p["thread_id"] != thread_id:
+                continue
+            norm = 1 - BM25_B + BM25_B * p["length"] / avg_length
+            scores[message_id] += idf * p["tf"] * (BM25_K1 + 1) / (p["tf"] + BM25_K1 * norm)
+
+    # Ties go to the newer message
+    ranked = sorted(scores.items(), key=lambda item: (item[1], item[0]), reverse=True)
+    page = ranked[offset:offset + limit]
+    if not page:
+        return {"query": query, "total": len(ranked), "results": []}
+
+    docs = await chat_messages.find(
+        {"_id": {"$in": [message_id for message_id, _ in page]}, "user_id": user_id}
+    ).to_list(None)
+    docs = {doc["_id"]: doc for doc in await rehydrate_messages(docs)}
+
+    threads = await chat_threads.find(
+        {"user_id": user_id, "thread_id": {"$in": list({d["thread_id"] for d in docs.values()})}},
+        {"thread_id": 1, "title": 1}
+    ).to_list(None)
+    titles = {t["thread_id"]: t.get("title") for t in threads}
+
+    results = []
+    for message_id, score in page:
+        doc = docs.get(message_id)
+        if doc is None:
+            continue
+        results.append({
+            "message_id": str(message_id),
+            "thread_id": doc["thread_id"],
+            "thread_title": titles.get(doc["thread_id"]),
+            "sender": doc.get("sender"),
+            "created_at": doc.get("created_at"),
+            "score": round(score, 4),
+            "snippet": make_snippet(doc.get("message") or "", terms)
+        })
+
+    return {"query": query, "total": len(ranked), "results": results}
+
+
+# ============================================================
+# BACKFILL
+# ============================================================
+async def reindex_all(batch_size: int = 500) -> int:
+    """Rebuilds the whole index from chat_messages. Run while the app is stopped."""
+    await chat_postings.delete_many({})
+    await chat_search_stats.delete_many({})
+
+    indexed = 0
+    batch = []
+    async for msg in chat_messages.find({}).sort("_id", 1):
+        batch.append(msg)
+        if len(batch) >= batch_size:
+            await index_messages(await rehydrate_messages(batch))
+            indexed += len(batch)
+            batch = []
+            logger.info(f"Indexed {indexed} messages")
+    if batch:
+        await index_messages(await rehydrate_messages(batch))
+        indexed += len(batch)
+
+    await chat_messages.update_many({"search_pending": True}, {"$unset": {"search_pending": ""}})
+    return indexed
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    logger.info(f"Done, indexed {asyncio.run(reindex_all())} messages")
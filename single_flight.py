@@ -0,0 +1,88 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+
+# ============================================================
+# SINGLE FLIGHT
+# ============================================================
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key: the first caller starts
+    the work, later callers await the same result (or exception). The work
+    runs as its own task, so a disconnecting caller does not cancel it for
+    the others; once the last waiter is cancelled the work is cancelled too.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self.started = 0
+        self.coalesced = 0
+        self.abandoned = 0
+
+    async def do(self, key, factory):
+        entry = self._calls.get(key)
+        if entry is None:
+            task = asyncio.ensure_future(factory())
+            entry = self._calls[key] = [task, 0]
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+            self.started += 1
+        else:
+            self.coalesced += 1
+
+        task = entry[0]
+        entry[1] += 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if entry[1] == 1 and not task.done():
+                self.abandoned += 1
+                task.cancel()
+            raise
+        finally:
+            entry[1] -= 1
+
+    async def cancel_all(self):
+        """Cancels every call still running (e.g. at shutdown) and waits for its cleanup."""
+        tasks = [task for task, _ in self._calls.values()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._calls),
+            "started": self.started,
+            "coalesced": self.coalesced,
+            "abandoned": self.abandoned,
+        }
+
+
+# ============================================================
+# KEYED LOCKS
+# ============================================================
+class KeyedLocks:
+    """One asyncio.Lock per key, dropped again once nobody holds or waits on it."""
+
+    def __init__(self):
+        self._locks = {}
+
+    @asynccontextmanager
+    async def hold(self, key):
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                self._locks.pop(key, None)
+
+    def stats(self) -> dict:
+        return {
+            "locked_keys": len(self._locks),
+            "waiting": sum(max(users - 1, 0) for _, users in self._locks.values()),
+        }
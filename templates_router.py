@@ -1,8 +1,6 @@
 import os
 import time
-import tempfile
 import logging
-import fitz 
 
 from fastapi import APIRouter, UploadFile, File, Form, HTTPException
 from fastapi.responses import PlainTextResponse
@@ -12,7 +10,6 @@ from dotenv import load_dotenv
 from bson import ObjectId
 from pymongo import MongoClient
 
-from docx import Document
 from pypdf import PdfReader
 
 from azure.storage.blob import BlobServiceClient
@@ -21,6 +18,10 @@ from azure.core.credentials import AzureKeyCredential
 
 from fastapi import Depends, Request
 from auth.middleware import get_current_user
+from extraction import extract_document_sync
+from idempotency import run_idempotent, fingerprint
+from uploads import read_upload, too_large, UPLOAD_MAX_BYTES
+from rate_limit import rate_limit
 
 # ============================================================
 # ENV + LOGGER
@@ -99,39 +100,47 @@ async def upload_template(
     if not user_id or not ObjectId.is_valid(user_id):
         raise HTTPException(status_code=400, detail="Invalid user_id in token")
 
-    file_bytes = await file.read()
+    file_bytes = await read_upload(file)
     if not file_bytes:
         raise HTTPException(status_code=400, detail="Empty file")
 
-    template_id = str(ObjectId())
-    blob_name = f"{user_id}/{template_id}_{file.filename}"
+    async def store_template():
+        template_id = str(ObjectId())
+        blob_name = f"{user_id}/{template_id}_{file.filename}"
 
-    logger.info(f"Uploading: {blob_name}")
+        logger.info(f"Uploading: {blob_name}")
 
-    container_client.get_blob_client(blob_name).upload_blob(
-        file_bytes, overwrite=True
-    )
+        container_client.get_blob_client(blob_name).upload_blob(
+            file_bytes, overwrite=True
+        )
 
-    template = {
-        "template_id": template_id,
-        "file_name": file.filename,
-        "blob_name": blob_name,
-        "uploaded_at": int(time.time()),
-        "status": "pending",     # 🆕 Added status field
-        # allowed values → pending, approved, rejected
-    }
+        template = {
+            "template_id": template_id,
+            "file_name": file.filename,
+            "blob_name": blob_name,
+            "uploaded_at": int(time.time()),
+            "status": "pending",     # 🆕 Added status field
+            # allowed values → pending, approved, rejected
+        }
 
-    users_collection.update_one(
-        {"_id": ObjectId(user_id)},
-        {"$push": {"templates": template}},
-        upsert=True
-    )
+        users_collection.update_one(
+            {"_id": ObjectId(user_id)},
+            {"$push": {"templates": template}},
+            upsert=True
+        )
 
-    return {
-        "status": "success",
-        "message": "Template uploaded",
-        "template": template
-    }
+        return {
+            "status": "success",
+            "message": "Template uploaded",
+            "template": template
+        }
+
+    # A retried upload with the same Idempotency-Key gets the first template back
+    # instead of a second blob and a duplicate `templates` entry
+    return await run_idempotent(
+        request, user_id, "templates.upload",
+        fingerprint(file.filename, file_bytes), store_template
+    )
 
 # ============================================================
 # LIST TEMPLATES
@@ -169,7 +178,7 @@ def list_templates(request: Request, user=Depends(get_current_user)):
     }
 # ============================================================
 # FETCH TEMPLATE CONTENT (ALWAYS TEXT)
-@router.get("/view/{template_id}")
+@router.get("/view/{template_id}", dependencies=[Depends(rate_limit("template_view"))])
 def view_template(
     template_id: str,
     request: Request,
@@ -240,7 +249,13 @@ def view_template(
     print("✔ BLOB PATH =", blob_path)
 
     blob_client = container_client.get_blob_client(blob_path)
-    file_bytes = blob_client.download_blob().readall()
+    downloader = blob_client.download_blob()
+
+    # Same cap as uploads; the parsers get the bytes directly (no temp file)
+    if downloader.size > UPLOAD_MAX_BYTES:
+        raise too_large()
+
+    file_bytes = downloader.readall()
 
     print("✔ FILE SIZE =", len(file_bytes), "bytes")
 
@@ -261,37 +276,15 @@ def view_template(
 
     # ================= DOCX ====================
     elif ext == "docx":
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".docx") as tmp:
-            tmp.write(file_bytes)
-            path = tmp.name
-
-        doc = Document(path)
-        parts = [p.text for p in doc.paragraphs]
-        print("✔ DOCX PARAGRAPH COUNT =", len(parts))
-
-        content = "<br>".join(parts)
-
-        os.remove(path)
+        content = extract_document_sync(file_bytes, file_name, mode="html")
+        print("✔ DOCX CONTENT LENGTH =", len(content))
 
     # ================= PDF =====================
     elif ext == "pdf":
         print("✔ STARTING PDF EXTRACTION")
 
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
-            tmp.write(file_bytes)
-            pdf_path = tmp.name
-
-        import fitz
-        doc = fitz.open(pdf_path)
-
-        html_content = ""
-        for i, page in enumerate(doc):
-            extracted = page.get_text("html")
-            print(f"✔ PAGE {i+1} HTML LENGTH =", len(extracted))
-            html_content += extracted
-
-        doc.close()
-        os.remove(pdf_path)
+        # Page ranges are parsed in parallel on the extraction process pool
+        html_content = extract_document_sync(file_bytes, file_name, mode="html")
 
         print("✔ TOTAL PDF HTML LENGTH =", len(html_content))
 
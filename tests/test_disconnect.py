@@ -0,0 +1,92 @@
+import asyncio
+
+from fastapi import FastAPI, Form, Request
+from fastapi.middleware.cors import CORSMiddleware
+
+from auth.middleware import JWTMiddleware
+from disconnect import cancel_on_disconnect
+from uploads import UploadLimitMiddleware
+
+BODY = b"question=q"
+
+
+def make_app(started: asyncio.Event, cancelled: asyncio.Event, work_seconds: float) -> FastAPI:
+    # Same middleware stack, in the same order, as app.py
+    app = FastAPI()
+    app.add_middleware(CORSMiddleware, allow_origins=["http://localhost:5173"])
+    app.add_middleware(UploadLimitMiddleware)
+    app.add_middleware(JWTMiddleware)
+
+    @app.post("/query")
+    async def query(request: Request, question: str = Form(...)):
+        async def turn():
+            started.set()
+            try:
+                await asyncio.sleep(work_seconds)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+            return {"answer": question}
+
+        return await cancel_on_disconnect(request, turn(), poll_seconds=0.01)
+
+    return app
+
+
+async def post(work_seconds: float, disconnect: bool):
+    """Sends the form body, then optionally drops the connection mid-turn."""
+    started, cancelled, gone = asyncio.Event(), asyncio.Event(), asyncio.Event()
+    app = make_app(started, cancelled, work_seconds)
+    body_sent = False
+    messages = []
+
+    async def receive():
+        nonlocal body_sent
+        if not body_sent:
+            body_sent = True
+            return {"type": "http.request", "body": BODY, "more_body": False}
+        await gone.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": "/query",
+        "raw_path": b"/query",
+        "query_string": b"",
+        "root_path": "",
+        "headers": [
+            (b"host", b"test"),
+            (b"content-type", b"application/x-www-form-urlencoded"),
+            (b"content-length", str(len(BODY)).encode()),
+        ],
+        "client": ("127.0.0.1", 50000),
+        "server": ("test", 80),
+    }
+
+    request = asyncio.create_task(app(scope, receive, send))
+    await asyncio.wait_for(started.wait(), 5)
+    if disconnect:
+        gone.set()
+    await asyncio.wait_for(request, 5)
+
+    status = next(m["status"] for m in messages if m["type"] == "http.response.start")
+    return status, cancelled.is_set()
+
+
+def test_disconnect_cancels_the_turn():
+    status, cancelled = asyncio.run(post(work_seconds=30, disconnect=True))
+    assert cancelled
+    assert status == 499
+
+
+def test_connected_client_gets_the_result():
+    status, cancelled = asyncio.run(post(work_seconds=0.05, disconnect=False))
+    assert not cancelled
+    assert status == 200
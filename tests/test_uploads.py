@@ -0,0 +1,70 @@
+from typing import Optional
+
+from fastapi import FastAPI, File, Form, UploadFile
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.testclient import TestClient
+
+import uploads
+from auth.middleware import JWTMiddleware
+from uploads import UploadLimitMiddleware, read_upload
+
+MAX_BODY = 64 * 1024
+MAX_FILE = 16 * 1024
+
+
+def make_app() -> FastAPI:
+    # Same middleware stack, in the same order, as app.py
+    app = FastAPI()
+    app.add_middleware(CORSMiddleware, allow_origins=["http://localhost:5173"])
+    app.add_middleware(UploadLimitMiddleware, max_body_bytes=MAX_BODY)
+    app.add_middleware(JWTMiddleware)
+
+    @app.post("/upload")
+    async def upload(question: str = Form(...), user_file: Optional[UploadFile] = File(None)):
+        data = await read_upload(user_file, max_bytes=MAX_FILE) if user_file else b""
+        return {"question": question, "size": len(data)}
+
+    return app
+
+
+client = TestClient(make_app())
+
+
+def post(size: int, headers: Optional[dict] = None):
+    return client.post(
+        "/upload",
+        data={"question": "q"},
+        files={"user_file": ("a.txt", b"x" * size, "text/plain")},
+        headers=headers or {}
+    )
+
+
+def test_upload_under_limits():
+    response = post(1024)
+    assert response.status_code == 200
+    assert response.json() == {"question": "q", "size": 1024}
+
+
+def test_file_over_upload_limit_is_413():
+    response = post(MAX_FILE + 1)
+    assert response.status_code == 413
+
+
+def test_body_over_cap_is_413():
+    response = post(MAX_BODY + 1)
+    assert response.status_code == 413
+    assert response.json()["detail"] == uploads.too_large().detail
+
+
+def test_chunked_body_over_cap_is_413():
+    def chunks():
+        yield b"--b\r\nContent-Disposition: form-data; name=\"question\"\r\n\r\nq\r\n"
+        for _ in range(MAX_BODY // 1024 + 1):
+            yield b"x" * 1024
+
+    response = client.post(
+        "/upload",
+        content=chunks(),
+        headers={"Content-Type": "multipart/form-data; boundary=b"}
+    )
+    assert response.status_code == 413
@@ -0,0 +1,199 @@
+import os
+import gzip
+import hashlib
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+logger = logging.getLogger("text_cache")
+logger.setLevel(logging.INFO)
+
+
+# ============================================================
+# ENV CONFIG
+# ============================================================
+# Bump when extraction output changes so stale cached text is never served.
+EXTRACTOR_VERSION = "1"
+
+TEXT_CACHE_MAX_MEMORY_BYTES = int(os.getenv("TEXT_CACHE_MAX_MEMORY_BYTES", str(64 * 1024 * 1024)))
+TEXT_CACHE_MAX_DISK_BYTES = int(os.getenv("TEXT_CACHE_MAX_DISK_BYTES", str(1024 * 1024 * 1024)))
+TEXT_CACHE_DIR = os.getenv(
+    "TEXT_CACHE_DIR",
+    os.path.join(tempfile.gettempdir(), "legal_text_cache")
+)
+
+
+def document_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+# ============================================================
+# TWO-TIER CACHE
+# ============================================================
+class TextCache:
+    """
+    Extracted-text cache keyed by content hash. Tier 1 is an in-memory LRU
+    bounded by total text size; tier 2 is a directory of gzip files bounded
+    by total size (oldest files pruned first). Safe to use from threads.
+    """
+
+    def __init__(self, max_memory_bytes: int, cache_dir: Optional[str], max_disk_bytes: int):
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+        self._memory_bytes = 0
+        self._max_memory_bytes = max_memory_bytes
+        self._lock = threading.Lock()
+
+        self._dir = cache_dir
+        self._max_disk_bytes = max_disk_bytes
+        self._disk_bytes = 0
+        if self._dir:
+            try:
+                os.makedirs(self._dir, exist_ok=True)
+                self._disk_bytes = sum(
+                    entry.stat().st_size for entry in os.scandir(self._dir) if entry.is_file()
+                )
+            except OSError as e:
+                logger.warning(f"Disk tier disabled, cannot use {self._dir}: {e}")
+                self._dir = None
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(content_hash: str, mode: str) -> str:
+        return f"{content_hash}-v{EXTRACTOR_VERSION}-{mode}"
+
+    # --------------------------------------------------------
+    # Memory tier
+    # --------------------------------------------------------
+    def _remember(self, key: str, text: str):
+        size = len(text)
+        if size > self._max_memory_bytes:
+            return
+
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._memory_bytes -= len(old)
+
+        self._entries[key] = text
+        self._memory_bytes += size
+
+        while self._memory_bytes > self._max_memory_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+
+    # --------------------------------------------------------
+    # Disk tier
+    # --------------------------------------------------------
+    def _path(self, key: str) -> str:
+        return os.path.join(self._dir, f"{key}.txt.gz")
+
+    def _read_disk(self, key: str) -> Optional[str]:
+        try:
+            with gzip.open(self._path(key), "rt", encoding="utf-8") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+        except (OSError, EOFError) as e:
+            logger.warning(f"Dropping unreadable cache file for {key}: {e}")
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+            return None
+
+    def _write_disk(self, key: str, text: str):
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with gzip.open(tmp_path, "wt", encoding="utf-8", compresslevel=3) as f:
+                f.write(text)
+            os.replace(tmp_path, path)
+            size = os.path.getsize(path)
+        except OSError as e:
+            logger.warning(f"Could not write cache file for {key}: {e}")
+            return
+
+        with self._lock:
+            self._disk_bytes += size
+            over_budget = self._disk_bytes > self._max_disk_bytes
+
+        if over_budget:
+            self._prune_disk()
+
+    def _prune_disk(self):
+        try:
+            files = sorted(
+                (entry for entry in os.scandir(self._dir) if entry.is_file()),
+                key=lambda entry: entry.stat().st_mtime
+            )
+        except OSError:
+            return
+
+        total = sum(entry.stat().st_size for entry in files)
+        target = self._max_disk_bytes * 0.9
+        for entry in files:
+            if total <= target:
+                break
+            try:
+                size = entry.stat().st_size
+                os.remove(entry.path)
+                total -= size
+            except OSError:
+                pass
+
+        with self._lock:
+            self._disk_bytes = total
+
+    # --------------------------------------------------------
+    # Public API
+    # --------------------------------------------------------
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            text = self._entries.get(key)
+            if text is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return text
+
+        if self._dir:
+            text = self._read_disk(key)
+            if text is not None:
+                with self._lock:
+                    self.disk_hits += 1
+                    self._remember(key, text)
+                return text
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, text: str):
+        with self._lock:
+            self._remember(key, text)
+
+        if self._dir:
+            self._write_disk(key, text)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+                "memory_entries": len(self._entries),
+                "memory_bytes": self._memory_bytes,
+                "disk_bytes": self._disk_bytes,
+            }
+
+
+text_cache = TextCache(
+    max_memory_bytes=TEXT_CACHE_MAX_MEMORY_BYTES,
+    cache_dir=TEXT_CACHE_DIR,
+    max_disk_bytes=TEXT_CACHE_MAX_DISK_BYTES
+)
@@ -0,0 +1,119 @@
+import os
+import asyncio
+import logging
+
+from history import save_turns
+
+logger = logging.getLogger("turn_writer")
+logger.setLevel(logging.INFO)
+
+
+# ============================================================
+# ENV CONFIG
+# ============================================================
+# Off (default): each turn is written before the response is returned.
+# On: turns are buffered and flushed in batches off the request path; a
+# crash can lose up to one flush interval of turns, a clean shutdown cannot.
+PERSIST_WRITE_BEHIND = os.getenv("PERSIST_WRITE_BEHIND", "false").lower() in ("1", "true", "yes")
+
+PERSIST_FLUSH_INTERVAL_SECONDS = float(os.getenv("PERSIST_FLUSH_INTERVAL_SECONDS", "0.2"))
+PERSIST_MAX_BATCH_TURNS = int(os.getenv("PERSIST_MAX_BATCH_TURNS", "100"))
+
+# When this many turns are waiting, submit() writes synchronously instead
+PERSIST_MAX_BUFFERED_TURNS = int(os.getenv("PERSIST_MAX_BUFFERED_TURNS", "1000"))
+
+PERSIST_RETRY_MAX_SECONDS = 5.0
+
+
+# ============================================================
+# TURN WRITER
+# ============================================================
+class TurnWriter:
+    def __init__(self, write_behind: bool):
+        self._write_behind = write_behind
+        self._buffer = []
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._closing = False
+
+        self.flushed_turns = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+
+    def start(self):
+        if self._write_behind and self._task is None:
+            self._task = asyncio.create_task(self._flush_loop())
+            logger.info("Write-behind turn persistence enabled")
+
+    async def submit(self, turn: dict):
+        if not self._write_behind or self._closing or len(self._buffer) >= PERSIST_MAX_BUFFERED_TURNS:
+            await save_turns([turn])
+            return
+
+        self._buffer.append(turn)
+        if len(self._buffer) >= PERSIST_MAX_BATCH_TURNS:
+            self._wakeup.set()
+
+    async def _flush(self) -> bool:
+        batch = self._buffer[:PERSIST_MAX_BATCH_TURNS]
+        if not batch:
+            return True
+
+        try:
+            await save_turns(batch)
+        except Exception as e:
+            # Keep the batch buffered; messages carry their _id and thread
+            # counters skip turns already counted, so retrying is safe
+            self.failed_flushes += 1
+            logger.error(f"Flushing {len(batch)} turns failed, will retry: {e}")
+            return False
+
+        del self._buffer[:len(batch)]
+        self.flushes += 1
+        self.flushed_turns += len(batch)
+        return True
+
+    async def _flush_loop(self):
+        delay = PERSIST_FLUSH_INTERVAL_SECONDS
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+            ok = True
+            while ok and self._buffer:
+                ok = await self._flush()
+
+            # Back off while Mongo is failing, reset once a flush succeeds
+            delay = PERSIST_FLUSH_INTERVAL_SECONDS if ok else min(delay * 2, PERSIST_RETRY_MAX_SECONDS)
+
+    async def close(self):
+        """Stops the flusher and writes everything still buffered."""
+        self._closing = True
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+        for attempt in range(3):
+            while self._buffer and await self._flush():
+                pass
+            if not self._buffer:
+                return
+            await asyncio.sleep(0.5 * (attempt + 1))
+
+        logger.critical(f"Shutting down with {len(self._buffer)} unsaved chat turns")
+
+    def stats(self) -> dict:
+        return {
+            "write_behind": self._write_behind,
+            "buffered_turns": len(self._buffer),
+            "flushes": self.flushes,
+            "flushed_turns": self.flushed_turns,
+            "failed_flushes": self.failed_flushes,
+        }
+
+
+turn_writer = TurnWriter(PERSIST_WRITE_BEHIND)
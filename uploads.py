@@ -0,0 +1,86 @@
+import os
+
+from fastapi import HTTPException, UploadFile
+from starlette.formparsers import MultiPartParser
+
+# ============================================================
+# ENV CONFIG
+# ============================================================
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(50 * 1024 * 1024)))
+
+# Uploads up to this size stay in memory while the multipart body is parsed;
+# only larger ones spill to a temporary file (Starlette's default is 1 MB).
+UPLOAD_SPOOL_MAX_BYTES = int(os.getenv("UPLOAD_SPOOL_MAX_BYTES", str(16 * 1024 * 1024)))
+
+# Room for the non-file form fields and multipart boundaries
+FORM_OVERHEAD_BYTES = 1024 * 1024
+
+MultiPartParser.spool_max_size = UPLOAD_SPOOL_MAX_BYTES
+
+
+def too_large() -> HTTPException:
+    return HTTPException(
+        status_code=413,
+        detail=f"Upload exceeds the {UPLOAD_MAX_BYTES // (1024 * 1024)} MB limit"
+    )
+
+
+async def read_upload(upload: UploadFile, max_bytes: int = UPLOAD_MAX_BYTES) -> bytes:
+    """
+    Returns the upload's bytes for in-memory parsing (fitz stream= / BytesIO),
+    rejecting files over the limit before reading them.
+    """
+    if upload.size is not None and upload.size > max_bytes:
+        raise too_large()
+
+    data = await upload.read()
+    if len(data) > max_bytes:
+        raise too_large()
+    return data
+
+
+# ============================================================
+# REQUEST BODY LIMIT
+# ============================================================
+class UploadLimitMiddleware:
+    """
+    Caps request bodies while they stream in, so an oversized upload is
+    rejected with 413 as soon as the limit is crossed instead of after the
+    whole body has been spooled. The HTTPException is raised from receive(),
+    i.e. inside FastAPI's body parsing, so the normal handlers (and CORS
+    headers) still apply. Must not sit behind a BaseHTTPMiddleware: raised
+    through one, the error arrives wrapped and FastAPI answers 400 instead.
+    """
+
+    def __init__(self, app, max_body_bytes: int = UPLOAD_MAX_BYTES + FORM_OVERHEAD_BYTES):
+        self.app = app
+        self.max_body_bytes = max_body_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        declared = None
+        for name, value in scope.get("headers", []):
+            if name == b"content-length":
+                try:
+                    declared = int(value)
+                except ValueError:
+                    pass
+                break
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            if declared is not None and declared > self.max_body_bytes:
+                raise too_large()
+
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_body_bytes:
+                    raise too_large()
+            return message
+
+        await self.app(scope, limited_receive, send)